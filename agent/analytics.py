@@ -0,0 +1,299 @@
+"""
+Предрасчитанная аналитика по отзывам: распределение оценок по месяцам, темы с цитатами,
+упоминания блюд из меню. Хранится компактным JSON в `data/review_analytics.json`,
+чтобы агент отвечал на обзорные вопросы одним lookup вместо суммирования сырых отзывов.
+
+Пересчёт инкрементальный: если начало CSV не изменилось (совпадает digest уже
+обработанных строк), досчитываются только новые строки.
+
+    python -m agent.analytics          # инкрементально
+    python -m agent.analytics --full   # с нуля
+"""
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import threading
+
+from agent.rag import DATA_DIR
+
+
+ANALYTICS_PATH = DATA_DIR / "review_analytics.json"
+ANALYTICS_VERSION = 2
+QUOTES_PER_SIDE = 2
+MAX_QUOTE_CHARS = 200
+
+# ключевые слова сопоставляются с началом слова, регистр не важен;
+# слова из WHOLE_WORDS — только целиком ("char", но не "charge" или "character")
+TOPICS: Dict[str, List[str]] = {
+    "delivery": ["delivery", "deliver", "arrived", "driver", "takeout", "drive home"],
+    "wait_time": ["wait", "minutes", "hour", "quickly", "slow"],
+    "crust": ["crust", "dough", "char", "charred", "crisp", "chewy", "soggy", "undercooked", "burnt", "burned"],
+    "sauce": ["sauce", "tomato"],
+    "cheese": ["cheese", "mozzarella", "ricotta"],
+    "toppings": ["topping"],
+    "service": ["service", "staff", "owner", "rude", "friendly", "accommodat"],
+    "price": ["price", "expensive", "overpriced", "value", "deal", "$"],
+    "cleanliness": ["dirty", "clean", "sticky", "hygien"],
+    "atmosphere": ["noisy", "loud", "atmosphere", "tv", "music", "trendy"],
+    "dietary": ["gluten", "vegan", "allerg", "celiac", "dairy", "vegetarian"],
+}
+
+WHOLE_WORDS = {"char"}
+
+# дополнительные написания к названиям из меню
+DISH_ALIASES: Dict[str, List[str]] = {
+    "Veggie Delight": ["veggie pizza", "vegetable pizza"],
+    "Chicken Wings": ["wings"],
+    "Chocolate Brownie": ["brownie"],
+    "Coca-Cola": ["coke"],
+}
+
+
+def _pattern(keywords: Iterable[str]) -> re.Pattern:
+    return re.compile(
+        "|".join(rf"(?<!\w){re.escape(kw)}" + (r"(?!\w)" if kw in WHOLE_WORDS else "") for kw in keywords),
+        re.IGNORECASE,
+    )
+
+
+TOPIC_PATTERNS = {topic: _pattern(kws) for topic, kws in TOPICS.items()}
+
+
+def _dish_patterns(data_dir: Path) -> Dict[str, re.Pattern]:
+    patterns = {}
+    menu_path = data_dir / "pizzeria_menu.csv"
+    if menu_path.exists():
+        with menu_path.open(newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                name = row.get("name", "").strip()
+                if name:
+                    patterns[name] = _pattern([name.lower(), *DISH_ALIASES.get(name, [])])
+    return patterns
+
+
+def _sentences(text: str) -> List[str]:
+    return [s.strip() for s in re.split(r"(?<=[.!?])\s+", text) if s.strip()]
+
+
+def _row_digest(digest, row: dict):
+    digest.update("\x1f".join(row.get(c, "") for c in ("Title", "Date", "Rating", "Review")).encode("utf-8"))
+    digest.update(b"\x1e")
+
+
+def empty_analytics() -> Dict:
+    return {
+        "version": ANALYTICS_VERSION,
+        "source_rows": 0,
+        "source_digest": hashlib.sha1().hexdigest(),
+        "ratings": [0, 0, 0, 0, 0],
+        "by_month": {},
+        "topics": {},
+        "dishes": {},
+    }
+
+
+def _add_quote(quotes: List[Dict], quote: Dict):
+    quotes.append(quote)
+    # самые свежие цитаты важнее
+    quotes.sort(key=lambda q: q["date"], reverse=True)
+    del quotes[QUOTES_PER_SIDE:]
+
+
+def fold_review(analytics: Dict, row: dict, dish_patterns: Dict[str, re.Pattern]):
+    rating_str = row.get("Rating", "").strip()
+    if not rating_str.isdigit() or not 1 <= int(rating_str) <= 5:
+        return
+    rating = int(rating_str)
+    date = row.get("Date", "").strip()
+    text = f"{row.get('Title', '').strip()}. {row.get('Review', '').strip()}"
+
+    analytics["ratings"][rating - 1] += 1
+    month = date[:7]
+    if month:
+        analytics["by_month"].setdefault(month, [0, 0, 0, 0, 0])[rating - 1] += 1
+
+    sentences = _sentences(row.get("Review", ""))
+    for topic, pattern in TOPIC_PATTERNS.items():
+        if not pattern.search(text):
+            continue
+        stats = analytics["topics"].setdefault(
+            topic, {"mentions": 0, "rating_sum": 0, "quotes": {"positive": [], "negative": []}}
+        )
+        stats["mentions"] += 1
+        stats["rating_sum"] += rating
+
+        side = "positive" if rating >= 4 else "negative" if rating <= 2 else None
+        quote = next((s for s in sentences if pattern.search(s) and len(s) <= MAX_QUOTE_CHARS), None)
+        if side and quote:
+            _add_quote(stats["quotes"][side], {"text": quote, "rating": rating, "date": date})
+
+    for dish, pattern in dish_patterns.items():
+        if pattern.search(text):
+            stats = analytics["dishes"].setdefault(dish, {"mentions": 0, "rating_sum": 0})
+            stats["mentions"] += 1
+            stats["rating_sum"] += rating
+
+
+def build_analytics(data_dir: Path = DATA_DIR, previous: Optional[Dict] = None) -> Dict:
+    """
+    Досчитывает `previous` по новым строкам CSV или строит аналитику с нуля,
+    если обработанная часть файла изменилась.
+    """
+    reviews_path = data_dir / "restaurant_reviews.csv"
+    dish_patterns = _dish_patterns(data_dir)
+
+    if previous is None or previous.get("version") != ANALYTICS_VERSION:
+        previous = empty_analytics()
+    analytics = previous
+    skip = analytics["source_rows"]
+
+    digest = hashlib.sha1()
+    rows_seen = 0
+    with reviews_path.open(newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            if rows_seen == skip and digest.hexdigest() != analytics["source_digest"]:
+                # начало файла поменялось — инкремент невозможен
+                return build_analytics(data_dir, previous=empty_analytics())
+            _row_digest(digest, row)
+            rows_seen += 1
+            if rows_seen > skip:
+                fold_review(analytics, row, dish_patterns)
+
+    if rows_seen < skip or (rows_seen == skip and digest.hexdigest() != analytics["source_digest"]):
+        return build_analytics(data_dir, previous=empty_analytics())
+
+    analytics["source_rows"] = rows_seen
+    analytics["source_digest"] = digest.hexdigest()
+    return analytics
+
+
+def save_analytics(analytics: Dict, path: Path = ANALYTICS_PATH):
+    # запись через временный файл: другой воркер не прочитает обрезанный JSON
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps(analytics, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def refresh(full: bool = False, path: Path = ANALYTICS_PATH) -> Dict:
+    previous = None
+    if not full and path.exists():
+        previous = json.loads(path.read_text(encoding="utf-8"))
+    analytics = build_analytics(previous=previous)
+    save_analytics(analytics, path)
+    return analytics
+
+
+# путь -> (mtime_ns, аналитика): воркер подхватывает пересчёт `python -m agent.analytics` без рестарта
+_cache: Dict[Path, Tuple[int, Dict]] = {}
+_cache_lock = threading.Lock()
+
+
+def _read(path: Path) -> Optional[Tuple[int, Dict]]:
+    try:
+        mtime = path.stat().st_mtime_ns
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached
+        analytics = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if analytics.get("version") != ANALYTICS_VERSION:
+        return None
+    return mtime, analytics
+
+
+def load_analytics(path: Path = ANALYTICS_PATH) -> Dict:
+    entry = _read(path)
+    if entry is None:
+        with _cache_lock:
+            entry = _read(path)
+            if entry is None:
+                # первый запуск или файл старой версии: CSV маленький, считаем на месте
+                save_analytics(build_analytics(), path)
+                entry = _read(path)
+    _cache[path] = entry
+    return entry[1]
+
+
+def _average(counts: List[int]) -> Optional[float]:
+    total = sum(counts)
+    if not total:
+        return None
+    return round(sum((i + 1) * c for i, c in enumerate(counts)) / total, 2)
+
+
+def resolve_topic(topic: str) -> Optional[str]:
+    """
+    Свободная формулировка темы -> ключ TOPICS: "wait time" -> wait_time, "staff" -> service.
+    """
+    key = re.sub(r"[\s-]+", "_", topic.strip().lower())
+    if key in TOPICS:
+        return key
+    return next((name for name, pattern in TOPIC_PATTERNS.items() if pattern.search(topic)), None)
+
+
+def summarize(topic: Optional[str] = None, dish: Optional[str] = None) -> Dict:
+    """
+    Компактный ответ для агента: общая сводка, тема с цитатами или статистика блюда.
+    """
+    analytics = load_analytics()
+    ratings = analytics["ratings"]
+    result: Dict = {
+        "reviews": sum(ratings),
+        "avg_rating": _average(ratings),
+    }
+
+    if topic:
+        key = resolve_topic(topic)
+        if key is None:
+            # модель выбрала тему вне списка: подсказываем допустимые
+            return {**result, "topic": topic, "topic_mentions": 0, "known_topics": list(TOPICS)}
+        stats = analytics["topics"].get(key)
+        if stats is None:
+            return {**result, "topic": key, "topic_mentions": 0}
+        result.update(
+            {
+                "topic": key,
+                "topic_mentions": stats["mentions"],
+                "topic_avg_rating": round(stats["rating_sum"] / stats["mentions"], 2),
+                "quotes": stats["quotes"],
+            }
+        )
+
+    if dish:
+        key = next((name for name in analytics["dishes"] if name.lower() == dish.strip().lower()), None)
+        if key is None:
+            key = next((name for name in analytics["dishes"] if dish.strip().lower() in name.lower()), None)
+        stats = analytics["dishes"].get(key) if key else None
+        result.update(
+            {
+                "dish": key or dish,
+                "dish_mentions": stats["mentions"] if stats else 0,
+                "dish_avg_rating": round(stats["rating_sum"] / stats["mentions"], 2) if stats else None,
+            }
+        )
+
+    if not topic and not dish:
+        result["rating_distribution"] = dict(zip("12345", ratings))
+        result["by_month"] = {month: _average(counts) for month, counts in sorted(analytics["by_month"].items())}
+        result["topics"] = {
+            name: {"mentions": s["mentions"], "avg_rating": round(s["rating_sum"] / s["mentions"], 2)}
+            for name, s in sorted(analytics["topics"].items(), key=lambda kv: -kv[1]["mentions"])
+        }
+
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Materialize review analytics")
+    parser.add_argument("--full", action="store_true", help="Пересчитать с нуля")
+    args = parser.parse_args()
+
+    result = refresh(full=args.full)
+    print(f"{result['source_rows']} reviews -> {ANALYTICS_PATH} ({ANALYTICS_PATH.stat().st_size} bytes)")
@@ -0,0 +1,217 @@
+"""
+Бэкенды эмбеддингов для RAG.
+
+`torch` — SentenceTransformers на PyTorch (как раньше), `onnx` / `onnx-int8` — та же модель,
+экспортированная в ONNX и запущенная через onnxruntime без torch в рантайме.
+
+Экспорт (нужен torch, выполняется один раз офлайн):
+
+    python -m agent.embeddings --model sentence-transformers/all-MiniLM-L6-v2 --quantize
+"""
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional, Tuple
+import argparse
+import json
+
+from langchain_core.embeddings import Embeddings
+
+from settings import settings
+
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model.int8.onnx"
+POOLING_FILE = "pooling.json"
+
+
+def onnx_model_dir(model_name: str) -> Path:
+    return Path(settings.ONNX_MODEL_DIR) / model_name.replace("/", "__")
+
+
+def split_backend(model_name: str, backend: Optional[str] = None) -> Tuple[str, str]:
+    """
+    `onnx-int8:sentence-transformers/all-MiniLM-L6-v2` -> ("onnx-int8", "sentence-transformers/...").
+    Без префикса берётся `backend` или `settings.EMBEDDING_BACKEND`.
+    """
+    prefix, sep, rest = model_name.partition(":")
+    if sep and prefix in BACKENDS:
+        return prefix, rest
+    return backend or settings.EMBEDDING_BACKEND, model_name
+
+
+def make_embeddings(model_name: str, backend: Optional[str] = None) -> Embeddings:
+    backend, model_name = split_backend(model_name, backend)
+
+    if backend == "torch":
+        from langchain_community.embeddings import SentenceTransformerEmbeddings
+
+        return SentenceTransformerEmbeddings(model_name=model_name)
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxEmbeddings(
+            model_dir=onnx_model_dir(model_name),
+            quantized=backend == "onnx-int8",
+            threads=settings.EMBEDDING_THREADS,
+        )
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Эмбеддинги из экспортированной ONNX-модели: токенизация через `tokenizers`,
+    инференс через onnxruntime, пулинг и нормализация на numpy.
+    """
+
+    def __init__(
+        self,
+        model_dir: Path,
+        quantized: bool = False,
+        threads: int = 0,
+        batch_size: int = 32,
+        cache_size: int = 4096,
+    ):
+        import numpy as np
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_dir = Path(model_dir)
+        model_path = model_dir / (ONNX_INT8_FILE if quantized else ONNX_FILE)
+        if not model_path.exists():
+            raise FileNotFoundError(
+                f"{model_path} not found, export it with `python -m agent.embeddings --model ...`"
+            )
+
+        self._np = np
+        self.batch_size = batch_size
+
+        pooling = json.loads((model_dir / POOLING_FILE).read_text(encoding="utf-8"))
+        self.pooling_mode = pooling.get("mode", "mean")
+        self.normalize = pooling.get("normalize", True)
+        self.max_seq_length = pooling.get("max_seq_length", 256)
+
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        padding = self.tokenizer.padding
+        self.pad_id = padding["pad_id"] if padding else 0
+        # паддим сами до ширины батча, см. _embed_batch
+        self.tokenizer.no_padding()
+
+        options = ort.SessionOptions()
+        # 0 — onnxruntime сам выбирает число потоков по числу ядер
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            str(model_path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        # кэш токенизации: повторяющиеся запросы и документы не токенизируются заново
+        self._encode = lru_cache(maxsize=cache_size)(self._encode_uncached)
+
+    def _encode_uncached(self, text: str) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+        enc = self.tokenizer.encode(text)
+        return tuple(enc.ids), tuple(enc.type_ids)
+
+    def _embed_batch(self, texts: List[str]):
+        np = self._np
+        encoded = [self._encode(t) for t in texts]
+        width = max(len(ids) for ids, _ in encoded)
+
+        input_ids = np.full((len(encoded), width), self.pad_id, dtype=np.int64)
+        token_type_ids = np.zeros((len(encoded), width), dtype=np.int64)
+        attention_mask = np.zeros((len(encoded), width), dtype=np.int64)
+        for row, (ids, type_ids) in enumerate(encoded):
+            input_ids[row, : len(ids)] = ids
+            token_type_ids[row, : len(ids)] = type_ids
+            attention_mask[row, : len(ids)] = 1
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = token_type_ids
+
+        hidden = self.session.run(None, feeds)[0]
+
+        if self.pooling_mode == "cls":
+            vectors = hidden[:, 0]
+        else:
+            mask = attention_mask[..., None].astype(hidden.dtype)
+            vectors = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        if self.normalize:
+            vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        out: List[List[float]] = []
+        for start in range(0, len(texts), self.batch_size):
+            out.extend(self._embed_batch(texts[start : start + self.batch_size]).tolist())
+        return out
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_batch([text])[0].tolist()
+
+
+def export_onnx(model_name: str, quantize: bool = False, opset: int = 17) -> Path:
+    """
+    Экспорт трансформера SentenceTransformers в ONNX (+ опционально int8 dynamic quantization).
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    out_dir = onnx_model_dir(model_name)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0]
+    auto_model = transformer.auto_model.eval()
+    tokenizer = transformer.tokenizer
+
+    pooling_module = next(
+        (m for m in st_model if type(m).__name__ == "Pooling"), None
+    )
+    pooling = {
+        "mode": "cls" if pooling_module is not None and pooling_module.pooling_mode_cls_token else "mean",
+        "normalize": any(type(m).__name__ == "Normalize" for m in st_model),
+        "max_seq_length": st_model.max_seq_length,
+    }
+    (out_dir / POOLING_FILE).write_text(json.dumps(pooling, indent=2), encoding="utf-8")
+    tokenizer.save_pretrained(str(out_dir))
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    dynamic_axes = {n: {0: "batch", 1: "sequence"} for n in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            auto_model,
+            tuple(sample[n] for n in input_names),
+            str(out_dir / ONNX_FILE),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(
+            str(out_dir / ONNX_FILE),
+            str(out_dir / ONNX_INT8_FILE),
+            weight_type=QuantType.QInt8,
+        )
+
+    return out_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a SentenceTransformers model to ONNX")
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL)
+    parser.add_argument("--quantize", action="store_true", help="Также сохранить int8-версию")
+    parser.add_argument("--opset", type=int, default=17)
+    args = parser.parse_args()
+
+    print(f"Exported to {export_onnx(args.model, quantize=args.quantize, opset=args.opset)}")
@@ -0,0 +1,243 @@
+"""
+Потоковая загрузка больших выгрузок отзывов (`Title,Date,Rating,Review`) в индекс Chroma.
+
+CSV читается пачками строк, каждая пачка нормализуется по колонкам и превращается
+в чанки с теми же метаданными, что и в `load_documents`. Эмбеддинги считает пул
+потоков, в полёте не больше `2 * workers` пачек, поэтому память не растёт с размером
+файла. Пачки пишутся в коллекцию по порядку через upsert с id = отпечаток текста:
+повторная запись той же пачки ничего не дублирует. После каждой записи в чекпоинт
+сохраняется позиция в файле, и прерванная загрузка продолжается с неё.
+
+    python -m agent.ingest exports/reviews.csv --batch-size 256 --workers 2
+    python -m agent.ingest exports/reviews.csv --restart   # игнорировать чекпоинт
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+import argparse
+import csv
+import json
+import logging
+import os
+import re
+import time
+
+from agent.embeddings import make_embeddings
+from agent.rag import (
+    CHROMA_DIR, DEFAULT_MODEL_NAME,
+    _fingerprint, collection_name, load_documents, parse_date, review_header, review_id, split_review,
+)
+
+
+REVIEW_COLUMNS = ("Title", "Date", "Rating", "Review")
+DEFAULT_BATCH_SIZE = 256
+LOG_EVERY_BATCHES = 50
+
+# пробелы и табы схлопываются, переводы строк остаются — по ним режутся чанки
+_SPACES = re.compile(r"[ \t\r\f\v]+")
+
+# в выгрузках даты сильно повторяются
+_date_key = lru_cache(maxsize=8192)(parse_date)
+
+
+Batch = Tuple[List[str], List[str], List[dict]]
+
+
+def checkpoint_path(path: Path) -> Path:
+    return path.with_name(path.name + ".ingest.json")
+
+
+def load_checkpoint(path: Path, source: Path, collection: str) -> dict:
+    if not path.exists():
+        return {}
+    state = json.loads(path.read_text(encoding="utf-8"))
+    if state.get("source") != str(source.resolve()) or state.get("collection") != collection:
+        logging.warning(f"Checkpoint {path} belongs to another file or collection, starting over")
+        return {}
+    return state
+
+
+def save_checkpoint(path: Path, state: dict):
+    # запись через временный файл: прерывание не оставит обрезанный JSON
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(state), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def read_batches(f, batch_size: int) -> Iterator[Tuple[List[List[str]], int]]:
+    """
+    Пачки сырых записей и позиция в файле после последней из них.
+
+    csv.reader берёт строки через readline, а не итерацией файла, иначе tell() недоступен.
+    """
+    reader = csv.reader(iter(f.readline, ""))
+    batch: List[List[str]] = []
+    for record in reader:
+        batch.append(record)
+        if len(batch) == batch_size:
+            yield batch, f.tell()
+            batch = []
+    if batch:
+        yield batch, f.tell()
+
+
+def normalize_batch(records: List[List[str]], columns: Dict[str, int]) -> Batch:
+    """
+    Записи CSV -> (ids, тексты, метаданные) чанков. Колонки обрабатываются целиком,
+    дубликаты внутри пачки схлопываются по отпечатку текста.
+    """
+
+    def column(name: str) -> List[str]:
+        i = columns.get(name)
+        if i is None:
+            return [""] * len(records)
+        return [r[i].strip() if i < len(r) else "" for r in records]
+
+    titles, dates, ratings = column("Title"), column("Date"), column("Rating")
+    reviews = [_SPACES.sub(" ", text) for text in column("Review")]
+    date_keys = [_date_key(d) if d else None for d in dates]
+
+    docs: Dict[str, Tuple[str, dict]] = {}
+    for title, date_str, rating, text, date_key in zip(titles, dates, ratings, reviews, date_keys):
+        if not text:
+            continue
+        metadata = {
+            "source": "review",
+            "title": title,
+            "date": date_str,
+            "review_id": review_id(title, date_str, rating, text),
+        }
+        if rating.isdigit():
+            metadata["rating"] = int(rating)
+        if date_key is not None:
+            metadata["date_key"] = date_key
+
+        header = review_header(title, date_str, rating)
+        chunks = split_review(text)
+        for i, chunk in enumerate(chunks):
+            content = header + chunk
+            docs.setdefault(_fingerprint(content), (content, {**metadata, "chunk": i, "chunks": len(chunks)}))
+
+    return list(docs), [content for content, _ in docs.values()], [meta for _, meta in docs.values()]
+
+
+def get_collection(persist_dir: Path = CHROMA_DIR, model_name: str = DEFAULT_MODEL_NAME):
+    import chromadb
+
+    client = chromadb.PersistentClient(path=str(persist_dir))
+    # та же коллекция, что у RAG с этой моделью
+    return client.get_or_create_collection(collection_name(model_name))
+
+
+def seed_collection(collection, embeddings):
+    """
+    Пустой индекс RAG заполнил бы сам, но после загрузки он уже не пуст: кладём меню и
+    встроенные отзывы заранее.
+    """
+    docs = load_documents()
+    by_id = {_fingerprint(d.page_content): d for d in docs}
+    texts = [d.page_content for d in by_id.values()]
+    collection.upsert(
+        ids=list(by_id),
+        embeddings=embeddings.embed_documents(texts),
+        metadatas=[d.metadata for d in by_id.values()],
+        documents=texts,
+    )
+
+
+def ingest_reviews(
+    path: Path,
+    persist_dir: Path = CHROMA_DIR,
+    model_name: str = DEFAULT_MODEL_NAME,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    workers: int = 2,
+    restart: bool = False,
+    embeddings=None,
+) -> dict:
+    ckpt = checkpoint_path(path)
+    state = {} if restart else load_checkpoint(ckpt, path, collection_name(model_name))
+    embeddings = embeddings or make_embeddings(model_name)
+    collection = get_collection(persist_dir, model_name)
+    if not state and collection.count() == 0:
+        seed_collection(collection, embeddings)
+
+    stats = {"rows": state.get("rows", 0), "chunks": state.get("chunks", 0), "resumed_from": state.get("rows", 0)}
+
+    pending = deque()
+
+    def write_oldest():
+        future, rows, offset = pending.popleft()
+        (ids, texts, metadatas), vectors = future.result()
+        if ids:
+            collection.upsert(ids=ids, embeddings=vectors, metadatas=metadatas, documents=texts)
+        stats["rows"] += rows
+        stats["chunks"] += len(ids)
+        save_checkpoint(
+            ckpt,
+            {
+                "source": str(path.resolve()),
+                "collection": collection.name,
+                "offset": offset,
+                "rows": stats["rows"],
+                "chunks": stats["chunks"],
+            },
+        )
+
+    t0 = time.perf_counter()
+    with path.open(newline="", encoding="utf-8") as f, ThreadPoolExecutor(max_workers=workers) as pool:
+        header = next(csv.reader([f.readline()]))
+        columns = {name.strip(): i for i, name in enumerate(header)}
+        missing = [c for c in REVIEW_COLUMNS if c not in columns]
+        if missing:
+            raise ValueError(f"{path} has no columns {missing}")
+        if state.get("offset"):
+            logging.info(f"Resuming {path} from row {state['rows']}")
+            f.seek(state["offset"])
+
+        def embed(records: List[List[str]]) -> Tuple[Batch, List[List[float]]]:
+            batch = normalize_batch(records, columns)
+            return batch, embeddings.embed_documents(batch[1]) if batch[1] else []
+
+        for n, (records, offset) in enumerate(read_batches(f, batch_size), 1):
+            pending.append((pool.submit(embed, records), len(records), offset))
+            # порядок записи = порядок чтения, чекпоинт только растёт
+            if len(pending) >= 2 * workers:
+                write_oldest()
+            if n % LOG_EVERY_BATCHES == 0:
+                logging.info(f"Ingested {stats['rows']} rows, {stats['chunks']} chunks")
+        while pending:
+            write_oldest()
+
+    elapsed = time.perf_counter() - t0
+    new_rows = stats["rows"] - stats["resumed_from"]
+    stats["seconds"] = round(elapsed, 2)
+    stats["rows_per_s"] = round(new_rows / elapsed, 1) if elapsed else None
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a reviews CSV export into the Chroma index")
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--persist-dir", type=Path, default=CHROMA_DIR)
+    parser.add_argument("--model", default=DEFAULT_MODEL_NAME)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--restart", action="store_true", help="Начать с начала файла, игнорируя чекпоинт")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    stats = ingest_reviews(
+        args.path,
+        persist_dir=args.persist_dir,
+        model_name=args.model,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        restart=args.restart,
+    )
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
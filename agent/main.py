@@ -1,68 +1,72 @@
 import json
 
-from typing import Annotated, TypedDict, List
+from functools import lru_cache
+from typing import Annotated, Any, Optional, TypedDict, List
 
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, ToolMessage
+from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
 
 from langgraph.graph import StateGraph, END
+from pydantic import ValidationError
 from langgraph.graph.message import add_messages
 
 from agent.tools import (
-    create_delivery_order, book_table, search_knowledge_base
+    create_delivery_order, book_table, search_knowledge_base, get_review_insights
 )
+from agent.rag import get_rag
+from agent.packing import get_tokenizer, pack_documents
+from agent import prefetch
+from agent.prompt import assemble, tool_schemas
+from settings import settings
 
 
-TOOLS = [create_delivery_order, book_table, search_knowledge_base]
+TOOLS = [create_delivery_order, book_table, search_knowledge_base, get_review_insights]
+REQUIRED_ARGS = {
+    t.name: t.args_schema.model_json_schema().get("required", []) for t in TOOLS
+}
 
 
 class AgentState(TypedDict):
     messages: Annotated[list, add_messages]
-
-
-SYSTEM_PROMPT = """
-You are a pizzeria assistant. This is a single establishment, not a chain.
-Your task is to help the user either place a home delivery pizza order OR reserve a table (only one action at a time!). You can also answer the user’s questions.
-
-You have access to a knowledge base with menu items and recent customer reviews. When users ask about ingredients, prices, recommendations, delivery expectations, or guest experiences, first call the tool `search_knowledge_base(query)` to ground your answer in real data.
-
-Rules:
-
-1. If the user requests home delivery, call the tool `create_delivery_order(pizza_name, address)`. Return the order number exactly as written in `id`.
-   If required data is missing (pizza name or address), ask a clarifying question.
-2. If the user requests a reservation, call the tool `book_table(time, name)`. Return the reservation number exactly as written in `id`.
-   If required data is missing (time or name), ask a clarifying question.
-3. If the user asks about menu items, prices, availability, popular choices, or feedback from visitors, call `search_knowledge_base` with a concise query. Use the retrieved facts in your reply.
-4. Do not invent data: if something is missing, ask for it.
-5. After calling the tool, briefly confirm the result to the user (you may show the `id`).
-
-IMPORTANT:
-
-* NEVER call a tool if the user request is unclear.
-* NEVER call a tool with empty or assumed arguments.
-* If data is missing or the input is unclear, ask a clarifying question in plain text.
-"""
+    # спекулятивный поиск текущего хода, см. agent/prefetch.py
+    prefetch: Optional[Any]
 
 
 # ----------------------------
 # Nodes
 # ----------------------------
 
-def llm_node(state: AgentState) -> AgentState:
-    llm = ChatOpenAI(
-        model="Qwen/Qwen2.5-3B-Instruct",
-        base_url="http://localhost:8000/v1",
-        api_key="EMPTY",
+@lru_cache(maxsize=1)
+def get_llm():
+    return ChatOpenAI(
+        model=settings.LLM_MODEL,
+        base_url=settings.LLM_BASE_URL,
+        api_key=settings.LLM_API_KEY,
         temperature=0,
-    ).bind_tools(TOOLS)
+    ).bind_tools(tool_schemas(TOOLS))
+
+
+def llm_node(state: AgentState) -> AgentState:
+    llm = get_llm()
 
     msgs = state["messages"]
-    if not msgs or not isinstance(msgs[0], SystemMessage):
-        msgs = [SystemMessage(content=SYSTEM_PROMPT)] + msgs
 
-    resp = llm.invoke(msgs)
+    # первый вызов LLM в ходе: параллельно начинаем поиск по сообщению пользователя
+    handle = None
+    if msgs and isinstance(msgs[-1], HumanMessage) and isinstance(msgs[-1].content, str):
+        handle = prefetch.start(msgs[-1].content)
+
+    try:
+        resp = llm.invoke(assemble(msgs))
+    except Exception:
+        prefetch.ignore(handle)
+        raise
+
+    if not any(call["name"] == prefetch.SEARCH_TOOL for call in resp.tool_calls or []):
+        prefetch.ignore(handle)
+        handle = None
 
-    return {"messages": [resp]}
+    return {"messages": [resp], "prefetch": handle}
 
 def route_after_llm(state):
     last = state["messages"][-1]
@@ -77,8 +81,9 @@ def route_after_llm(state):
     call = last.tool_calls[0]
     args = call.get("args") or {}
 
-    # защита от пустых аргументов
-    if any(not v or not str(v).strip() for v in args.values()):
+    # защита от пустых аргументов (необязательные фильтры поиска могут быть пустыми)
+    required = REQUIRED_ARGS.get(call["name"], args.keys())
+    if any(not args.get(k) or not str(args.get(k)).strip() for k in required):
         return "end"
 
     return "tools"
@@ -94,17 +99,28 @@ def tools_node(state: AgentState) -> AgentState:
         name = call["name"]
         args = call.get("args", {}) or {}
 
-        if name == "create_delivery_order":
-            out = create_delivery_order.invoke(args)
-        elif name == "book_table":
-            out = book_table.invoke(args)
-        elif name == "search_knowledge_base":
-            out = search_knowledge_base.invoke(args)
-        else:
-            out = {"status": "error", "message": f"Unknown tool: {name}"}
+        try:
+            if name == "create_delivery_order":
+                out = create_delivery_order.invoke(args)
+            elif name == "book_table":
+                out = book_table.invoke(args)
+            elif name == "search_knowledge_base":
+                docs = prefetch.consume(state.get("prefetch"), args)
+                if docs is not None:
+                    out = pack_documents(docs)
+                else:
+                    out = search_knowledge_base.invoke(args)
+            elif name == "get_review_insights":
+                out = get_review_insights.invoke(args)
+            else:
+                out = {"status": "error", "message": f"Unknown tool: {name}"}
+        except ValidationError as e:
+            # аргументы придумала модель: возвращаем ошибку ей же, а не роняем граф
+            problems = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            out = {"status": "error", "message": f"Invalid arguments for {name}: {problems}"}
 
         try:
-            content = json.dumps(out, ensure_ascii=False)
+            content = json.dumps(out, ensure_ascii=False, separators=(",", ":"))
         except Exception as e:
             content = str(out)
             print(f"Failed to serialize tool output to JSON: {out!r}\nError: {e}")
@@ -125,9 +141,22 @@ def build_app():
     return g.compile()
 
 
-def main(state: AgentState) -> AgentState:
-    app = build_app()
-    return app.invoke({"messages": state["messages"] + [HumanMessage(content=user)]}, config=None)
+def warm_up() -> None:
+    """
+    Загружает клиента LLM, модель эмбеддингов, индекс и токенизатор упаковки до первого запроса.
+    """
+    get_llm()
+    get_rag().retriever.invoke("warm-up")
+    get_tokenizer()
+
+
+@lru_cache(maxsize=1)
+def get_app():
+    return build_app()
+
+
+def main(state: AgentState, user: str) -> AgentState:
+    return get_app().invoke({"messages": state["messages"] + [HumanMessage(content=user)]}, config=None)
 
 
 
@@ -144,9 +173,7 @@ if __name__ == "__main__":
         if user.lower() in {"exit", "quit"}:
             break
         
-        state["messages"] + [HumanMessage(content=user)]
-        
-        state = main(state)
+        state = main(state, user)
         for msg in state["messages"][-1:]:
             if isinstance(msg, AIMessage):
                 print("Ассистент:", msg.content)
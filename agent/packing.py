@@ -0,0 +1,117 @@
+"""
+Упаковка результатов поиска в контекст модели: одна компактная строка на документ
+без повторов полей и обрезка по бюджету токенов, посчитанному токенизатором
+обслуживающей модели.
+"""
+from typing import Dict, List, Optional
+import logging
+import threading
+import time
+
+from langchain_core.documents import Document
+
+from agent.rag import review_header
+from settings import settings
+
+
+# кавычки, запятая и перевод строки вокруг каждой строки в JSON-списке
+LINE_OVERHEAD_TOKENS = 2
+# меньше этого остатка бюджета обрезанная строка уже бесполезна
+MIN_TRUNCATED_TOKENS = 24
+
+
+# загрузка может идти в HF hub: после неудачи повторяем не чаще, чем раз в столько секунд
+TOKENIZER_RETRY_SECONDS = 60
+
+_tokenizer = None
+_tokenizer_retry_at = 0.0
+_tokenizer_lock = threading.Lock()
+
+
+def get_tokenizer():
+    """
+    Токенизатор обслуживающей модели или None, пока он недоступен. Неудачная загрузка
+    не запоминается на весь процесс, а пока один поток грузит, остальные считают по оценке.
+    """
+    global _tokenizer, _tokenizer_retry_at
+    if _tokenizer is not None or time.monotonic() < _tokenizer_retry_at:
+        return _tokenizer
+    if not _tokenizer_lock.acquire(blocking=False):
+        return _tokenizer
+    try:
+        if _tokenizer is None and time.monotonic() >= _tokenizer_retry_at:
+            from tokenizers import Tokenizer
+
+            _tokenizer = Tokenizer.from_pretrained(settings.TOKENIZER_NAME)
+    except Exception as e:
+        _tokenizer_retry_at = time.monotonic() + TOKENIZER_RETRY_SECONDS
+        logging.warning(
+            f"Tokenizer {settings.TOKENIZER_NAME} unavailable, falling back to estimate, "
+            f"retrying in {TOKENIZER_RETRY_SECONDS}s: {e}"
+        )
+    finally:
+        _tokenizer_lock.release()
+    return _tokenizer
+
+
+def count_tokens(text: str) -> int:
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        # ~4 символа на токен для английского текста
+        return max(1, len(text) // 4)
+    return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return text[: max(0, max_tokens - 1) * 4].rstrip() + "…"
+    ids = tokenizer.encode(text, add_special_tokens=False).ids
+    if len(ids) <= max_tokens:
+        return text
+    return tokenizer.decode(ids[: max_tokens - 1]).rstrip() + "…"
+
+
+def format_document(doc: Document) -> str:
+    """
+    `menu | Pizza | Margherita | $12.99 | Tomato sauce, mozzarella, fresh basil`
+    `review | 5/5 | 2024-03-15 | Best pizza in town | The crust was ...`
+    """
+    meta = doc.metadata
+    if meta.get("source") == "menu":
+        description = meta.get("description") or doc.page_content
+        return f"menu | {meta.get('category')} | {meta.get('name')} | ${meta.get('price')} | {description}"
+
+    header = review_header(meta.get("title"), meta.get("date"), meta.get("rating"))
+    text = doc.page_content
+    if text.startswith(header):
+        text = text[len(header):]
+    return f"review | {meta.get('rating')}/5 | {meta.get('date')} | {meta.get('title')} | {text}"
+
+
+def pack_documents(docs: List[Document], budget: Optional[int] = None) -> Dict:
+    """
+    Строки добавляются в порядке релевантности, пока помещаются в бюджет; первая
+    не поместившаяся обрезается, если остаток бюджета ещё осмысленный.
+    """
+    budget = settings.CONTEXT_TOKEN_BUDGET if budget is None else budget
+
+    lines: List[str] = []
+    used = 0
+    for doc in docs:
+        line = format_document(doc)
+        cost = count_tokens(line) + LINE_OVERHEAD_TOKENS
+        if used + cost <= budget:
+            lines.append(line)
+            used += cost
+            continue
+
+        remaining = budget - used - LINE_OVERHEAD_TOKENS
+        if remaining >= MIN_TRUNCATED_TOKENS:
+            lines.append(truncate_tokens(line, remaining))
+        break
+
+    packed: Dict = {"matches": lines}
+    if len(lines) < len(docs):
+        packed["omitted"] = len(docs) - len(lines)
+    return packed
@@ -0,0 +1,155 @@
+"""
+Спекулятивный prefetch поиска: эмбеддинг и векторный поиск по сырому сообщению
+пользователя запускаются одновременно с первым запросом к LLM. Если модель затем
+вызывает `search_knowledge_base` с близким по смыслу запросом и без фильтров,
+инструмент берёт готовый результат вместо повторного поиска.
+
+Число одновременных prefetch ограничено `PREFETCH_MAX_INFLIGHT`: если все слоты
+заняты, prefetch просто не запускается, так что под нагрузкой он не добавляет работы.
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional
+import logging
+import threading
+import time
+
+from langchain_core.documents import Document
+
+from agent.rag import get_rag
+from settings import settings
+
+
+SEARCH_TOOL = "search_knowledge_base"
+FILTER_ARGS = ("source", "category", "min_rating", "max_rating", "date_from", "date_to")
+
+
+@dataclass
+class PrefetchStats:
+    started: int = 0
+    skipped_busy: int = 0
+    hits: int = 0
+    misses: int = 0
+    ignored: int = 0
+    saved_ms: float = 0.0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, **deltas):
+        with self.lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            resolved = self.hits + self.misses
+            return {
+                "started": self.started,
+                "skipped_busy": self.skipped_busy,
+                "hits": self.hits,
+                "misses": self.misses,
+                "ignored": self.ignored,
+                "hit_rate": self.hits / resolved if resolved else None,
+                "saved_ms_total": round(self.saved_ms, 1),
+            }
+
+
+STATS = PrefetchStats()
+_slots = threading.BoundedSemaphore(settings.PREFETCH_MAX_INFLIGHT)
+
+
+@lru_cache(maxsize=1)
+def _executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=settings.PREFETCH_MAX_INFLIGHT, thread_name_prefix="prefetch")
+
+
+@dataclass
+class Prefetch:
+    query: str
+    started_at: float
+    future: Optional[Future] = None
+    finished_at: Optional[float] = None
+    consumed: bool = False
+
+
+def _run(handle: Prefetch):
+    try:
+        rag = get_rag()
+        vector = rag.embeddings.embed_query(handle.query)
+        return vector, rag.search_by_vector(vector)
+    finally:
+        handle.finished_at = time.perf_counter()
+
+
+def start(query: str) -> Optional[Prefetch]:
+    if not settings.PREFETCH_ENABLED or not query.strip():
+        return None
+    if not _slots.acquire(blocking=False):
+        STATS.add(skipped_busy=1)
+        return None
+
+    handle = Prefetch(query=query, started_at=time.perf_counter())
+    try:
+        handle.future = _executor().submit(_run, handle)
+    except RuntimeError:
+        _slots.release()
+        return None
+    # слот освобождается и при завершении, и при отмене ещё не начатой задачи
+    handle.future.add_done_callback(lambda _: _slots.release())
+    STATS.add(started=1)
+    return handle
+
+
+def ignore(handle: Optional[Prefetch]):
+    """
+    Модель не стала искать: отменяем, если ещё не началось, иначе результат просто выбрасывается.
+    """
+    if handle is None or handle.consumed:
+        return
+    handle.consumed = True
+    handle.future.cancel()
+    STATS.add(ignored=1)
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = (sum(x * x for x in a) ** 0.5) * (sum(y * y for y in b) ** 0.5)
+    return dot / norm if norm else 0.0
+
+
+def consume(handle: Optional[Prefetch], args: Dict) -> Optional[List[Document]]:
+    """
+    Возвращает документы prefetch, если вызов инструмента совпадает с ним по смыслу.
+    Если запрос модели уже пришлось эмбеддить для сверки, но он не совпал, поиск идёт
+    по этому вектору здесь же, без второго эмбеддинга. None — инструмент ищет сам.
+    """
+    if handle is None or handle.consumed:
+        return None
+    handle.consumed = True
+
+    query = (args.get("query") or "").strip()
+    if any(args.get(name) not in (None, "") for name in FILTER_ARGS) or not query or handle.future.cancelled():
+        handle.future.cancel()
+        STATS.add(misses=1)
+        return None
+
+    t0 = time.perf_counter()
+    try:
+        vector, docs = handle.future.result()
+    except Exception as e:
+        logging.warning(f"Prefetch failed: {e}")
+        STATS.add(misses=1)
+        return None
+
+    if query.lower() != handle.query.strip().lower():
+        rag = get_rag()
+        query_vector = rag.embeddings.embed_query(query)
+        if _cosine(vector, query_vector) < settings.PREFETCH_SIMILARITY:
+            STATS.add(misses=1)
+            return rag.search_by_vector(query_vector)
+
+    # без prefetch поиск занял бы столько же, сколько сам prefetch; вычитаем ожидание и сверку
+    spent = time.perf_counter() - t0
+    search_time = (handle.finished_at or time.perf_counter()) - handle.started_at
+    STATS.add(hits=1, saved_ms=max(0.0, search_time - spent) * 1000)
+    return docs
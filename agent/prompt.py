@@ -0,0 +1,67 @@
+"""
+Сборка промпта с побайтно стабильным префиксом для prefix caching в vLLM.
+
+Сервер переиспользует KV-кэш только для совпадающего начала запроса, поэтому
+системный промпт и схемы инструментов собираются канонически: инструменты
+отсортированы по имени, ключи схем упорядочены, текст промпта версионирован.
+Всё, что меняется от запроса к запросу, идёт после истории диалога.
+"""
+from typing import Dict, List, Sequence
+import hashlib
+import json
+
+from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+
+# меняется вместе с любой правкой SYSTEM_PROMPT или схем инструментов
+PROMPT_VERSION = "2026-10.2"
+
+SYSTEM_PROMPT = """
+You are a pizzeria assistant. This is a single establishment, not a chain.
+Your task is to help the user either place a home delivery pizza order OR reserve a table (only one action at a time!). You can also answer the user’s questions.
+
+You have access to a knowledge base with menu items and recent customer reviews. When users ask about ingredients, prices, recommendations, delivery expectations, or guest experiences, first call the tool `search_knowledge_base(query)` to ground your answer in real data.
+
+Rules:
+
+1. If the user requests home delivery, call the tool `create_delivery_order(pizza_name, address)`. Return the order number exactly as written in `id`.
+   If required data is missing (pizza name or address), ask a clarifying question.
+2. If the user requests a reservation, call the tool `book_table(time, name)`. Return the reservation number exactly as written in `id`.
+   If required data is missing (time or name), ask a clarifying question.
+3. If the user asks about menu items, prices, availability, popular choices, or feedback from visitors, call `search_knowledge_base` with a concise query. Use the retrieved facts in your reply.
+4. For general questions about what guests think overall (e.g. "what do people say about delivery?", "how is the pepperoni rated?"), call `get_review_insights(topic, dish)` instead — it returns ready-made aggregates and quotes.
+5. Do not invent data: if something is missing, ask for it.
+6. After calling the tool, briefly confirm the result to the user (you may show the `id`).
+
+IMPORTANT:
+
+* NEVER call a tool if the user request is unclear.
+* NEVER call a tool with empty or assumed arguments.
+* If data is missing or the input is unclear, ask a clarifying question in plain text.
+"""
+
+
+def canonical(obj):
+    """
+    Та же структура с ключами словарей в отсортированном порядке на всех уровнях.
+    """
+    return json.loads(json.dumps(obj, sort_keys=True, ensure_ascii=False))
+
+
+def tool_schemas(tools: Sequence) -> List[Dict]:
+    schemas = [canonical(convert_to_openai_tool(t)) for t in tools]
+    return sorted(schemas, key=lambda s: s["function"]["name"])
+
+
+def assemble(history: Sequence[BaseMessage]) -> List[BaseMessage]:
+    """
+    Канонический системный промпт в начале, затем история без посторонних системных сообщений.
+    """
+    return [SystemMessage(content=SYSTEM_PROMPT)] + [m for m in history if not isinstance(m, SystemMessage)]
+
+
+def prefix_digest(tools: Sequence) -> str:
+    payload = {"version": PROMPT_VERSION, "system": SYSTEM_PROMPT, "tools": tool_schemas(tools)}
+    raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
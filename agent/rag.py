@@ -1,96 +1,307 @@
-from langchain_community.embeddings import SentenceTransformerEmbeddings
-from langchain_community.vectorstores import Chroma
 from langchain_core.documents import Document
 
+from datetime import date
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional
 import csv
+import hashlib
+import re
+import threading
+
+from agent.embeddings import make_embeddings, split_backend
+from settings import settings
+
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+CHROMA_DIR = DATA_DIR / "chroma_db"
+DEFAULT_MODEL_NAME = settings.EMBEDDING_MODEL
+DEFAULT_K = 8
+
+# версия входит в имя коллекции: при смене схемы метаданных индекс пересобирается сам
+COLLECTION_PREFIX = "pizzeria-knowledge-v5"
+
+MENU_CATEGORIES = ("Pizza", "Sides", "Drinks", "Desserts")
+
+REVIEW_CHUNK_SIZE = 500
+REVIEW_CHUNK_OVERLAP = 80
+
+# 1 — чистая релевантность, 0 — максимальное разнообразие результатов
+MMR_LAMBDA = 0.7
+
+
+def collection_name(model_name: str = DEFAULT_MODEL_NAME) -> str:
+    """
+    Коллекция на модель эмбеддингов: векторы разных моделей не смешиваются в одном индексе.
+    Префикс бэкенда (`onnx:`) не учитывается — пространство у модели то же. Хэш полного
+    имени держит имя в пределах 63 символов, которые допускает Chroma.
+    """
+    _, base = split_backend(model_name)
+    short = re.sub(r"[^A-Za-z0-9._-]+", "-", base.rsplit("/", 1)[-1])[:24].strip("-._")
+    return f"{COLLECTION_PREFIX}-{short}-{hashlib.sha1(base.encode('utf-8')).hexdigest()[:8]}"
+
+
+def doc_id(doc: Document) -> str:
+    """
+    Стабильный идентификатор документа: `menu:<name>` или `review:<title>`.
+    """
+    source = doc.metadata.get("source")
+    if source == "menu":
+        return f"menu:{doc.metadata.get('name')}"
+    return f"review:{doc.metadata.get('title')}"
+
+
+def review_id(title: str, date: str, rating, text: str) -> str:
+    """
+    Идентификатор отзыва целиком, общий для всех его чанков. Заголовки повторяются
+    ("Great pizza!"), поэтому в него входит и текст.
+    """
+    return _fingerprint(f"{title}\x1f{date}\x1f{rating}\x1f{text}")[:16]
+
+
+def collapse_key(doc: Document) -> str:
+    """
+    Ключ, по которому чанки одного отзыва схлопываются в выдаче.
+    """
+    return doc.metadata.get("review_id") or doc_id(doc)
+
+
+def category_key(category: str) -> str:
+    """
+    Ключ категории без регистра и множественного числа: "Desserts", "dessert" -> "dessert".
+    """
+    return category.strip().lower().rstrip("s")
+
+
+def review_header(title: str, date: str, rating) -> str:
+    return f"Review titled '{title}' on {date} rated {rating}/5: "
+
+
+def parse_date(value: str) -> Optional[int]:
+    """
+    `2024-03-15` -> 20240315. Chroma сравнивает через $gte/$lte только числа.
+    """
+    try:
+        parsed = date.fromisoformat(value.strip())
+    except (ValueError, AttributeError):
+        return None
+    return parsed.year * 10000 + parsed.month * 100 + parsed.day
+
+
+def _fingerprint(text: str) -> str:
+    normalized = re.sub(r"\s+", " ", text).strip().lower()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def split_review(text: str) -> List[str]:
+    if len(text) <= REVIEW_CHUNK_SIZE:
+        return [text]
+
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=REVIEW_CHUNK_SIZE,
+        chunk_overlap=REVIEW_CHUNK_OVERLAP,
+        separators=["\n\n", "\n", ". ", "! ", "? ", ", ", " ", ""],
+    )
+    return splitter.split_text(text)
+
+
+def load_documents(data_dir: Path = DATA_DIR) -> List[Document]:
+    """
+    Собираем документы из CSV меню и отзывов, чтобы раздать их в Chroma.
+    Длинные отзывы режутся на чанки, дубликаты (одинаковый текст с точностью
+    до регистра и пробелов) отбрасываются.
+    """
+    documents: List[Document] = []
+    seen = set()
+
+    def add(content: str, metadata: dict):
+        fingerprint = _fingerprint(content)
+        if fingerprint in seen:
+            return
+        seen.add(fingerprint)
+        documents.append(Document(page_content=content, metadata=metadata))
+
+    menu_path = data_dir / "pizzeria_menu.csv"
+    if menu_path.exists():
+        with menu_path.open(newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                name = row.get("name", "").strip()
+                category = row.get("category", "").strip()
+                description = row.get("description", "").strip()
+                price = row.get("price_usd", "").strip()
+
+                content = (
+                    f"Menu item: {name} (category: {category}). "
+                    f"Description: {description}. Price: ${price} USD."
+                )
+                add(
+                    content,
+                    {
+                        "source": "menu",
+                        "name": name,
+                        "category": category,
+                        "category_key": category_key(category),
+                        "price": price,
+                        "description": description,
+                    },
+                )
+
+    reviews_path = data_dir / "restaurant_reviews.csv"
+    if reviews_path.exists():
+        with reviews_path.open(newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                title = row.get("Title", "").strip()
+                date_str = row.get("Date", "").strip()
+                rating = row.get("Rating", "").strip()
+                review_text = row.get("Review", "").strip()
+
+                metadata = {
+                    "source": "review",
+                    "title": title,
+                    "date": date_str,
+                    "review_id": review_id(title, date_str, rating, review_text),
+                }
+                if rating.isdigit():
+                    metadata["rating"] = int(rating)
+                date_key = parse_date(date_str)
+                if date_key is not None:
+                    metadata["date_key"] = date_key
+
+                # заголовок повторяется в каждом чанке, чтобы чанк был понятен сам по себе
+                header = review_header(title, date_str, rating)
+                chunks = split_review(review_text)
+                for i, chunk in enumerate(chunks):
+                    add(header + chunk, {**metadata, "chunk": i, "chunks": len(chunks)})
+
+    return documents
+
+
+def build_filter(
+    source: Optional[str] = None,
+    category: Optional[str] = None,
+    min_rating: Optional[int] = None,
+    max_rating: Optional[int] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> Optional[Dict]:
+    """
+    Собирает `where` для Chroma, чтобы фильтрация шла внутри векторного поиска,
+    а не по уже найденным k документам.
+    """
+    conditions: List[Dict] = []
+
+    if source:
+        conditions.append({"source": {"$eq": source}})
+    if category:
+        conditions.append({"category_key": {"$eq": category_key(category)}})
+    if min_rating is not None:
+        conditions.append({"rating": {"$gte": int(min_rating)}})
+    if max_rating is not None:
+        conditions.append({"rating": {"$lte": int(max_rating)}})
+    for value, op in ((date_from, "$gte"), (date_to, "$lte")):
+        if not value:
+            continue
+        date_key = parse_date(value)
+        if date_key is None:
+            raise ValueError(f"Invalid date {value!r}, expected YYYY-MM-DD")
+        conditions.append({"date_key": {op: date_key}})
+
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
 
 class RAG:
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
-        self.embeddings = SentenceTransformerEmbeddings(model_name=model_name)
-        self.retriever = self._build_retriever()
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME, k: int = DEFAULT_K):
+        self.k = k
+        self.collection_name = collection_name(model_name)
+        # `onnx:<model>` / `onnx-int8:<model>` выбирают ONNX-бэкенд, иначе settings.EMBEDDING_BACKEND
+        self.embeddings = make_embeddings(model_name)
+        self.vectorstore = self._build_vectorstore()
+        self.retriever = self.vectorstore.as_retriever(search_kwargs={"k": self.k})
 
     def _load_documents(self) -> List[Document]:
+        return load_documents()
+
+
+    def _build_vectorstore(self):
+        # Chroma тянет chromadb/onnx при импорте, поэтому грузим его только при сборке индекса
+        from langchain_community.vectorstores import Chroma
+
+        vectorstore = Chroma(
+            collection_name=self.collection_name,
+            persist_directory=str(CHROMA_DIR),
+            embedding_function=self.embeddings,
+        )
+        if not vectorstore.get(limit=1, include=[])["ids"]:
+            # id = отпечаток текста (как в agent/ingest.py): параллельные сборки из разных
+            # процессов перезапишут те же записи, а не задублируют индекс
+            docs = self._load_documents()
+            vectorstore.add_documents(docs, ids=[_fingerprint(d.page_content) for d in docs])
+
+        return vectorstore
+
+    def search(
+        self, query: str, k: Optional[int] = None, mmr: bool = True, **filters
+    ) -> List[Document]:
         """
-        Собираем документы из CSV меню и отзывов, чтобы раздать их в Chroma.
+        Поиск с фильтрами по метаданным (см. build_filter). По умолчанию через MMR,
+        чтобы почти одинаковые отзывы не занимали несколько мест в выдаче. Чанки
+        одного отзыва схлопываются в один результат — остаётся самый релевантный.
         """
-        root_dir = Path(__file__).resolve().parent.parent
-        data_dir = root_dir / "data"
-
-        documents: List[Document] = []
-
-        menu_path = data_dir / "pizzeria_menu.csv"
-        if menu_path.exists():
-            with menu_path.open(newline="", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    name = row.get("name", "").strip()
-                    category = row.get("category", "").strip()
-                    description = row.get("description", "").strip()
-                    price = row.get("price_usd", "").strip()
-
-                    content = (
-                        f"Menu item: {name} (category: {category}). "
-                        f"Description: {description}. Price: ${price} USD."
-                    )
-                    documents.append(
-                        Document(
-                            page_content=content,
-                            metadata={
-                                "source": "menu",
-                                "name": name,
-                                "category": category,
-                                "price": price,
-                            },
-                        )
-                    )
-
-        reviews_path = data_dir / "restaurant_reviews.csv"
-        if reviews_path.exists():
-            with reviews_path.open(newline="", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    title = row.get("Title", "").strip()
-                    date = row.get("Date", "").strip()
-                    rating = row.get("Rating", "").strip()
-                    review_text = row.get("Review", "").strip()
-
-                    content = (
-                        f"Review titled '{title}' on {date} rated {rating}/5: {review_text}"
-                    )
-                    documents.append(
-                        Document(
-                            page_content=content,
-                            metadata={
-                                "source": "review",
-                                "title": title,
-                                "date": date,
-                                "rating": rating,
-                            },
-                        )
-                    )
-
-        return documents
-
-
-    def _build_retriever(self):
-        persist_dir = Path(__file__).resolve().parent.parent / "data" / "chroma_db"
-
-        if persist_dir.exists() and any(persist_dir.iterdir()):
-            vectorstore = Chroma(
-                collection_name="pizzeria-knowledge",
-                persist_directory=str(persist_dir),
-                embedding_function=self.embeddings,
+        return self.search_by_vector(self.embeddings.embed_query(query), k=k, mmr=mmr, **filters)
+
+    def search_by_vector(
+        self, vector: List[float], k: Optional[int] = None, mmr: bool = True, **filters
+    ) -> List[Document]:
+        k = k or self.k
+        where = build_filter(**filters)
+        # запас под чанки одного и того же отзыва
+        if mmr:
+            docs = self.vectorstore.max_marginal_relevance_search_by_vector(
+                vector, k=k * 2, fetch_k=k * 4, lambda_mult=MMR_LAMBDA, filter=where
             )
         else:
-            vectorstore = Chroma.from_documents(
-                self._load_documents(),
-                embedding=self.embeddings,
-                collection_name="pizzeria-knowledge",
-                persist_directory=str(persist_dir),
-            )
-            vectorstore.persist()
+            docs = self.vectorstore.similarity_search_by_vector(vector, k=k * 2, filter=where)
+
+        results: List[Document] = []
+        seen = set()
+        for doc in docs:
+            key = collapse_key(doc)
+            if key in seen:
+                continue
+            seen.add(key)
+            results.append(doc)
+            if len(results) == k:
+                break
+        return results
+
+    def count(self, **filters) -> int:
+        """
+        Размер кандидатного множества для набора фильтров.
+        """
+        where = build_filter(**filters)
+        return len(self.vectorstore.get(where=where, include=[])["ids"])
+
+
+_rag: Optional[RAG] = None
+_rag_lock = threading.Lock()
+
 
-        _retriever = vectorstore.as_retriever(search_kwargs={"k": 8})
-        return _retriever
\ No newline at end of file
+def get_rag() -> RAG:
+    """
+    Один RAG на процесс: модель эмбеддингов и индекс загружаются при первом вызове.
+    lru_cache не сериализует промахи, а первыми сюда одновременно приходят прогрев,
+    prefetch и воркеры replay, поэтому построение под блокировкой.
+    """
+    global _rag
+    if _rag is None:
+        with _rag_lock:
+            if _rag is None:
+                _rag = RAG()
+    return _rag
@@ -0,0 +1,133 @@
+"""
+Пакетный прогон разговоров через граф агента без FastAPI и Postgres — для регрессионных
+проверок при смене промпта или модели и как бенчмарк пропускной способности графа.
+
+Вход — JSONL, по разговору на строку: `{"id": "c1", "messages": ["реплика 1", "реплика 2"]}`.
+Выход — JSONL с транскриптами, вызовами инструментов, расходом токенов и временем узлов.
+
+    python -m agent.replay conversations.jsonl --out transcripts.jsonl --workers 8 \\
+        --base-url http://localhost:8000/v1 --model Qwen/Qwen2.5-3B-Instruct
+"""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+import argparse
+import json
+import statistics
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from settings import settings
+
+
+def run_turn(app, history: List, text: str) -> Dict:
+    """
+    Один ход: узлы графа выполняются последовательно, поэтому время между
+    соседними обновлениями stream_mode="updates" — это время узла.
+    """
+    messages = history + [HumanMessage(content=text)]
+    turn = {"user": text, "tool_calls": [], "nodes": [], "usage": {"input_tokens": 0, "output_tokens": 0}}
+    pending_calls = {}
+
+    t_start = t_prev = time.perf_counter()
+    for update in app.stream({"messages": messages}, stream_mode="updates"):
+        now = time.perf_counter()
+        for node, payload in update.items():
+            turn["nodes"].append({"node": node, "ms": round((now - t_prev) * 1000, 1)})
+            for msg in (payload or {}).get("messages", []):
+                messages.append(msg)
+                if isinstance(msg, AIMessage):
+                    usage = msg.usage_metadata or {}
+                    turn["usage"]["input_tokens"] += usage.get("input_tokens", 0)
+                    turn["usage"]["output_tokens"] += usage.get("output_tokens", 0)
+                    for call in msg.tool_calls:
+                        entry = {"name": call["name"], "args": call.get("args", {})}
+                        pending_calls[call["id"]] = entry
+                        turn["tool_calls"].append(entry)
+                elif isinstance(msg, ToolMessage) and msg.tool_call_id in pending_calls:
+                    pending_calls[msg.tool_call_id]["result"] = msg.content
+        t_prev = now
+
+    turn["latency_ms"] = round((time.perf_counter() - t_start) * 1000, 1)
+    last = messages[-1]
+    turn["response"] = last.content if isinstance(last, AIMessage) else None
+    return {"turn": turn, "messages": messages}
+
+
+def replay_conversation(app, conversation: Dict) -> Dict:
+    result = {"id": conversation.get("id"), "turns": []}
+    history: List = []
+    try:
+        for text in conversation.get("messages", []):
+            out = run_turn(app, history, text)
+            result["turns"].append(out["turn"])
+            # как и в бэкенде, в историю попадают только реплики пользователя и ИИ
+            history = [
+                m if isinstance(m, HumanMessage) else AIMessage(content=m.content)
+                for m in out["messages"]
+                if isinstance(m, (HumanMessage, AIMessage))
+            ]
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def summarize(results: List[Dict], elapsed: float) -> Dict:
+    turns = [t for r in results for t in r["turns"]]
+    by_node: Dict[str, List[float]] = {}
+    for t in turns:
+        for n in t["nodes"]:
+            by_node.setdefault(n["node"], []).append(n["ms"])
+
+    return {
+        "conversations": len(results),
+        "errors": sum(1 for r in results if "error" in r),
+        "turns": len(turns),
+        "turns_per_s": round(len(turns) / elapsed, 2) if elapsed else None,
+        "turn_ms_p50": statistics.median(t["latency_ms"] for t in turns) if turns else None,
+        "input_tokens": sum(t["usage"]["input_tokens"] for t in turns),
+        "output_tokens": sum(t["usage"]["output_tokens"] for t in turns),
+        "node_ms_p50": {node: statistics.median(ms) for node, ms in by_node.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay JSONL conversations through the agent graph")
+    parser.add_argument("input", type=Path)
+    parser.add_argument("--out", type=Path, default=Path("transcripts.jsonl"))
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--base-url", default=settings.LLM_BASE_URL)
+    parser.add_argument("--model", default=settings.LLM_MODEL)
+    parser.add_argument("--api-key", default=settings.LLM_API_KEY)
+    args = parser.parse_args()
+
+    # до первого get_llm(), клиент кэшируется
+    settings.LLM_BASE_URL = args.base_url
+    settings.LLM_MODEL = args.model
+    settings.LLM_API_KEY = args.api_key
+
+    from agent.main import TOOLS, get_app
+    from agent.prompt import PROMPT_VERSION, prefix_digest
+
+    with args.input.open(encoding="utf-8") as f:
+        conversations = [json.loads(line) for line in f if line.strip()]
+
+    app = get_app()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(lambda c: replay_conversation(app, c), conversations))
+    elapsed = time.perf_counter() - t0
+
+    with args.out.open("w", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    report = summarize(results, elapsed)
+    # транскрипты сравнимы между прогонами только при одинаковом промпте
+    report["prompt"] = {"version": PROMPT_VERSION, "prefix_digest": prefix_digest(TOOLS)}
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
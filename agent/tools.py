@@ -1,7 +1,10 @@
 from langchain_core.tools import tool
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
+from typing import Literal, Optional
 
-from agent.rag import RAG
+from agent.analytics import TOPICS, summarize
+from agent.packing import pack_documents
+from agent.rag import MENU_CATEGORIES, category_key, get_rag
 
 
 class DeliveryOrderIn(BaseModel):
@@ -27,41 +30,94 @@ def book_table(time: str, name: str) -> dict:
 
 class KnowledgeSearchInput(BaseModel):
     query: str = Field(..., description="Вопрос или ключевые слова для поиска по меню и отзывам")
+    source: Optional[Literal["menu", "review"]] = Field(
+        None, description="Искать только в меню ('menu') или только в отзывах ('review')"
+    )
+    category: Optional[str] = Field(
+        None, description=f"Категория меню: {', '.join(MENU_CATEGORIES)}"
+    )
+    min_rating: Optional[int] = Field(None, ge=1, le=5, description="Минимальная оценка отзыва (1-5)")
+    max_rating: Optional[int] = Field(None, ge=1, le=5, description="Максимальная оценка отзыва (1-5)")
+    date_from: Optional[str] = Field(None, description="Отзывы не раньше даты, формат YYYY-MM-DD")
+    date_to: Optional[str] = Field(None, description="Отзывы не позже даты, формат YYYY-MM-DD")
+
+    # фильтры заполняет модель: неверный фильтр ослабляем, а не роняем ход
+    @field_validator("source", mode="before")
+    @classmethod
+    def _normalize_source(cls, value):
+        if not isinstance(value, str):
+            return None
+        value = value.strip().lower().rstrip("s")
+        return value if value in ("menu", "review") else None
+
+    @field_validator("category", mode="before")
+    @classmethod
+    def _normalize_category(cls, value):
+        if not isinstance(value, str):
+            return None
+        known = {category_key(c): c for c in MENU_CATEGORIES}
+        return known.get(category_key(value))
+
+    @field_validator("min_rating", "max_rating", mode="before")
+    @classmethod
+    def _clamp_rating(cls, value):
+        try:
+            return min(max(int(float(value)), 1), 5)
+        except (TypeError, ValueError):
+            return None
 
 @tool(
     "search_knowledge_base",
     args_schema=KnowledgeSearchInput,
     description=(
         "Поиск по базе знаний меню и отзывов. Используй это, когда нужно ответить на "
-        "вопросы про блюда, цены, состав, популярные позиции, ожидание доставки или впечатления гостей."
+        "вопросы про блюда, цены, состав, популярные позиции, ожидание доставки или впечатления гостей. "
+        "Фильтры необязательны: указывай их, только если пользователь явно ограничил источник, "
+        "категорию, оценку или период."
+    ),
+)
+def search_knowledge_base(
+    query: str,
+    source: Optional[str] = None,
+    category: Optional[str] = None,
+    min_rating: Optional[int] = None,
+    max_rating: Optional[int] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> dict:
+    rag = get_rag()
+    try:
+        docs = rag.search(
+            query,
+            source=source or None,
+            category=category or None,
+            min_rating=min_rating,
+            max_rating=max_rating,
+            date_from=date_from or None,
+            date_to=date_to or None,
+        )
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+
+    # MMR уже убрал почти-дубликаты, упаковщик сжимает формат и режет по бюджету токенов
+    return pack_documents(docs)
+
+
+class ReviewInsightsInput(BaseModel):
+    # свободная строка: тему вне списка summarize сопоставит сам или вернёт допустимые
+    topic: Optional[str] = Field(
+        None, description=f"Тема отзывов, одна из: {', '.join(TOPICS)}"
+    )
+    dish: Optional[str] = Field(None, description="Название блюда из меню, например 'Pepperoni'")
+
+@tool(
+    "get_review_insights",
+    args_schema=ReviewInsightsInput,
+    description=(
+        "Готовая сводка по всем отзывам: средняя оценка и её динамика по месяцам, темы "
+        "(доставка, корж, сервис и т.д.) с типичными цитатами, оценки конкретных блюд. Используй для "
+        "обобщающих вопросов вроде 'что говорят о доставке?' или 'как оценивают пепперони?'."
     ),
 )
-def search_knowledge_base(query: str) -> dict:
-    rag = RAG()
-    docs = rag.retriever.invoke(query)
-
-    results = []
-    for doc in docs:
-        source = doc.metadata.get("source")
-        if source == "menu":
-            results.append(
-                {
-                    "type": "menu",
-                    "name": doc.metadata.get("name"),
-                    "category": doc.metadata.get("category"),
-                    "price_usd": doc.metadata.get("price"),
-                    "detail": doc.page_content,
-                }
-            )
-        else:
-            results.append(
-                {
-                    "type": "review",
-                    "title": doc.metadata.get("title"),
-                    "date": doc.metadata.get("date"),
-                    "rating": doc.metadata.get("rating"),
-                    "detail": doc.page_content,
-                }
-            )
-
-    return {"matches": results}
\ No newline at end of file
+def get_review_insights(topic: Optional[str] = None, dish: Optional[str] = None) -> dict:
+    return summarize(topic=topic or None, dish=dish or None)
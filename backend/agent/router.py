@@ -1,22 +1,28 @@
-from fastapi import APIRouter, Depends, Request, HTTPException
-from typing import Optional, Annotated 
+from fastapi import APIRouter, Depends, Request, HTTPException, WebSocket, WebSocketDisconnect, status
+from typing import Dict, Optional, Annotated 
 
 from langchain_core.messages import HumanMessage, AIMessage
-from agent.main import build_app
-
-from sqlalchemy.future import select
 
 from backend.agent.schemas import UserAgentRequest, UserAgentResponse
-from backend.auth.utils import jwt_required
+from backend.auth.utils import jwt_required, decode_access_token
 from backend.user.utils import get_user_by_phone
-from backend.agent.utils import fetch_chat_messages_langchain, fetch_chat_messages_raw
+from backend.agent.utils import (
+    fetch_chat_messages_langchain, fetch_chat_messages_raw, get_agent_app,
+    get_or_create_chat, to_chat_messages,
+)
 from backend.schemas import Session
-from backend.database import models
+from backend.database import db, models
+from settings import settings
 
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
+from collections import deque
+
+import asyncio
+import json
 import logging
+import time
 
 
 
@@ -27,7 +33,7 @@ agent = APIRouter(
 )
 
 @agent.post("/")
-@limiter.limit("5/minute")
+@limiter.limit(f"{settings.AGENT_RATE_LIMIT_PER_MINUTE}/minute")
 async def agent_endpoint(
     request: Request,
     payload: Annotated[UserAgentRequest, Depends()],
@@ -39,20 +45,8 @@ async def agent_endpoint(
         raise HTTPException(status_code=404, detail="User not found.")
 
     user_id = user.id
-    chat_id: Optional[int] = getattr(payload, "chat_id", None)
-
-    if chat_id is None:
-        chat = models.Chat(user_id=user_id)
-        session.add(chat)
-        await session.flush()
-        chat_id = chat.id
-    else:
-        res = await session.execute(
-            select(models.Chat).where(models.Chat.id == chat_id, models.Chat.user_id == user_id)
-        )
-        chat = res.scalar_one_or_none()
-        if chat is None:
-            raise HTTPException(status_code=404, detail="Chat not found.")
+    chat = await get_or_create_chat(session, user_id, getattr(payload, "chat_id", None))
+    chat_id = chat.id
 
     session.add(
         models.ChatMessage(
@@ -66,7 +60,8 @@ async def agent_endpoint(
     history = await fetch_chat_messages_langchain(session, chat_id)
 
     try:
-        state = await build_app().ainvoke({"messages": history}, config=None)
+        agent_app = await asyncio.to_thread(get_agent_app)
+        state = await agent_app.ainvoke({"messages": history}, config=None)
     except Exception as e:
         logging.error(f"Agent processing failed: {e}")
         raise HTTPException(status_code=500, detail=f"Agent processing failed.")
@@ -75,24 +70,7 @@ async def agent_endpoint(
     last_message = messages[-1] if messages else None
 
     new_messages = messages[len(history):] if len(messages) >= len(history) else messages
-    for msg in new_messages:
-        if isinstance(msg, HumanMessage):
-            role = models.MessageRole.USER
-            content = msg.content
-        elif isinstance(msg, AIMessage):
-            role = models.MessageRole.AI
-            content = msg.content
-        else:
-            logging.info(f"Skipping unsupported message type: {msg!r}")
-            continue
-
-        session.add(
-            models.ChatMessage(
-                chat_id=chat_id,
-                role=role,
-                content=content,
-            )
-        )
+    session.add_all(to_chat_messages(chat_id, new_messages))
 
     await session.commit()
 
@@ -103,4 +81,167 @@ async def agent_endpoint(
         "chat_id": chat_id,
         "response": last_message.content if isinstance(last_message, AIMessage) else "No response from agent.",
         "messages": full_chat,
-    }
\ No newline at end of file
+    }
+
+
+@agent.get("/prefetch_stats")
+async def prefetch_stats():
+    """
+    Счётчики спекулятивного поиска этого процесса: hit rate и сэкономленное время.
+    """
+    # импорт здесь, чтобы роутер не тянул RAG при старте
+    from agent import prefetch
+
+    return prefetch.STATS.snapshot()
+
+
+# ----------------------------
+# WebSocket
+# ----------------------------
+
+_ws_connections = 0
+
+# окна лимита сообщений по адресу клиента, общие для всех его соединений,
+# как у slowapi на POST /agent/ (тот же ключ get_remote_address)
+_ws_windows: Dict[str, deque] = {}
+_WS_WINDOWS_SWEEP_AT = 1024
+
+
+def _ws_rate_limited(key: str) -> bool:
+    now = time.monotonic()
+    if key not in _ws_windows and len(_ws_windows) >= _WS_WINDOWS_SWEEP_AT:
+        for stale in [k for k, w in _ws_windows.items() if not w or now - w[-1] > 60]:
+            del _ws_windows[stale]
+
+    window = _ws_windows.setdefault(key, deque())
+    while window and now - window[0] > 60:
+        window.popleft()
+    if len(window) >= settings.AGENT_RATE_LIMIT_PER_MINUTE:
+        return True
+    window.append(now)
+    return False
+
+
+def _parse_ws_message(raw: str) -> str:
+    """
+    Принимает `{"message": "..."}` или просто текст.
+    """
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        return raw.strip()
+    if isinstance(data, dict):
+        return str(data.get("message") or "").strip()
+    return raw.strip()
+
+
+@agent.websocket("/ws")
+async def agent_websocket(websocket: WebSocket, chat_id: Optional[int] = None):
+    """
+    Постоянный канал чата: JWT, пользователь и владение чатом проверяются один раз
+    при подключении, история хранится в памяти соединения. Ход стоит вызова LLM
+    и одной вставки в chat_messages.
+
+    Клиенту отправляются события `ready`, `token` (текст по мере генерации),
+    `message` (итоговый ответ) и `error`.
+    """
+    global _ws_connections
+
+    if _ws_connections >= settings.WS_MAX_CONNECTIONS:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason="Too many connections")
+        return
+    _ws_connections += 1
+
+    try:
+        try:
+            jwt_payload = decode_access_token(websocket.cookies.get("access_token"))
+        except HTTPException as e:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+            return
+
+        async with db.new_session() as session:
+            user = await get_user_by_phone(session, phone=jwt_payload.get("phone"))
+            if not user:
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="User not found.")
+                return
+            try:
+                chat = await get_or_create_chat(session, user.id, chat_id)
+            except HTTPException as e:
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+                return
+            chat_id = chat.id
+            history = await fetch_chat_messages_langchain(session, chat_id)
+            await session.commit()
+
+        await websocket.accept()
+        await websocket.send_json({"type": "ready", "chat_id": chat_id})
+
+        agent_app = await asyncio.to_thread(get_agent_app)
+        rate_key = get_remote_address(websocket)
+
+        while True:
+            try:
+                raw = await asyncio.wait_for(websocket.receive_text(), timeout=settings.WS_IDLE_TIMEOUT)
+            except asyncio.TimeoutError:
+                await websocket.close(code=status.WS_1000_NORMAL_CLOSURE, reason="Idle timeout")
+                return
+
+            if jwt_payload.get("exp") and time.time() > jwt_payload["exp"]:
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Token has expired")
+                return
+
+            text = _parse_ws_message(raw)
+            if not text:
+                await websocket.send_json({"type": "error", "detail": "Empty message."})
+                continue
+
+            # тот же лимит, что и у POST /agent/ (slowapi не работает с WebSocket)
+            if _ws_rate_limited(rate_key):
+                await websocket.send_json({"type": "error", "detail": "Rate limit exceeded."})
+                continue
+
+            user_message = HumanMessage(content=text)
+            new_messages = []
+            try:
+                async for mode, chunk in agent_app.astream(
+                    {"messages": history + [user_message]},
+                    stream_mode=["messages", "updates"],
+                ):
+                    if mode == "messages":
+                        message, metadata = chunk
+                        if metadata.get("langgraph_node") == "llm" and message.content:
+                            await websocket.send_json({"type": "token", "content": message.content})
+                    else:
+                        for update in chunk.values():
+                            new_messages.extend((update or {}).get("messages", []))
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                logging.error(f"Agent processing failed: {e}")
+                await websocket.send_json({"type": "error", "detail": "Agent processing failed."})
+                continue
+
+            rows = to_chat_messages(chat_id, [user_message, *new_messages])
+            async with db.new_session() as session:
+                session.add_all(rows)
+                await session.commit()
+
+            # в памяти та же история, что вернула бы выборка из БД
+            history.extend(
+                HumanMessage(content=row.content) if row.role == models.MessageRole.USER
+                else AIMessage(content=row.content)
+                for row in rows
+            )
+
+            last_message = new_messages[-1] if new_messages else None
+            await websocket.send_json(
+                {
+                    "type": "message",
+                    "chat_id": chat_id,
+                    "response": last_message.content if isinstance(last_message, AIMessage) else "No response from agent.",
+                }
+            )
+    except WebSocketDisconnect:
+        pass
+    finally:
+        _ws_connections -= 1
@@ -7,6 +7,39 @@ from sqlalchemy import select
 from langchain_core.messages import HumanMessage, AIMessage
 from sqlalchemy.ext.asyncio import AsyncSession
 from backend.database import models
+from fastapi import HTTPException
+
+from typing import Optional
+import logging
+import threading
+
+
+_agent_app = None
+_agent_app_lock = threading.Lock()
+
+
+def get_agent_app():
+    """
+    Граф агента компилируется один раз и лениво: langchain_openai, langgraph, Chroma и
+    модель эмбеддингов импортируются только при первом запросе к агенту (или при прогреве).
+    Прогрев и первые запросы приходят сюда из разных потоков, поэтому сборка под блокировкой.
+    """
+    global _agent_app
+    if _agent_app is None:
+        with _agent_app_lock:
+            if _agent_app is None:
+                from agent.main import build_app
+
+                _agent_app = build_app()
+    return _agent_app
+
+
+def warm_up_agent() -> None:
+    from agent.main import warm_up
+
+    get_agent_app()
+    warm_up()
+
 
 async def fetch_chat_messages_raw(
     session: AsyncSession,
@@ -50,6 +83,45 @@ async def fetch_chat_messages_langchain(
             out.append(HumanMessage(content=content))
         elif role == models.MessageRole.AI:
             out.append(AIMessage(content=content))
+        elif role == models.MessageRole.SUMMARY:
+            out.append(AIMessage(content=f"[Summary of the earlier conversation] {content}"))
+        else:
+            continue
+    return out
+
+
+async def get_or_create_chat(
+    session: AsyncSession,
+    user_id: int,
+    chat_id: Optional[int],
+) -> models.Chat:
+    if chat_id is None:
+        chat = models.Chat(user_id=user_id)
+        session.add(chat)
+        await session.flush()
+        return chat
+
+    res = await session.execute(
+        select(models.Chat).where(models.Chat.id == chat_id, models.Chat.user_id == user_id)
+    )
+    chat = res.scalar_one_or_none()
+    if chat is None:
+        raise HTTPException(status_code=404, detail="Chat not found.")
+    return chat
+
+
+def to_chat_messages(chat_id: int, messages: list) -> list[models.ChatMessage]:
+    """
+    Строки chat_messages для новых сообщений графа: сохраняются только реплики пользователя и ИИ.
+    """
+    rows = []
+    for msg in messages:
+        if isinstance(msg, HumanMessage):
+            role = models.MessageRole.USER
+        elif isinstance(msg, AIMessage):
+            role = models.MessageRole.AI
         else:
+            logging.info(f"Skipping unsupported message type: {msg!r}")
             continue
-    return out
\ No newline at end of file
+        rows.append(models.ChatMessage(chat_id=chat_id, role=role, content=msg.content))
+    return rows
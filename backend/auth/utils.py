@@ -37,8 +37,7 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     return encoded_jwt    
 
 
-def jwt_required(request: Request):
-    token = request.cookies.get("access_token")
+def decode_access_token(token: str | None) -> dict:
     if not token:
         raise HTTPException(status_code=401, detail="Unauthenticated")
 
@@ -56,4 +55,8 @@ def jwt_required(request: Request):
     if not payload.get("is_verified"):
         raise HTTPException(status_code=403, detail="User is not verified")
 
-    return payload
\ No newline at end of file
+    return payload
+
+
+def jwt_required(request: Request):
+    return decode_access_token(request.cookies.get("access_token"))
\ No newline at end of file
@@ -1,5 +1,5 @@
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
-from backend.database import models
+from backend.database import models, metrics
 from collections.abc import AsyncGenerator
 from settings import settings
 
@@ -14,10 +14,16 @@ engine_path = "postgresql+asyncpg://{user}:{password}@{host}:{port}/{db}" \
                     db=settings.POSTGRES_DB
                 )
 
+profile = dict(settings.DB_ENGINE_PROFILES[settings.DB_PROFILE])
+statement_cache_size = profile.pop("prepared_statement_cache_size")
+
 engine = create_async_engine(
     engine_path,
-    echo=True,
+    poolclass=metrics.TimedAsyncQueuePool,
+    connect_args={"prepared_statement_cache_size": statement_cache_size},
+    **profile,
 )
+metrics.instrument(engine)
 
 new_session = async_sessionmaker(
     bind=engine,
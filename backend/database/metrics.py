@@ -0,0 +1,91 @@
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from fastapi import Request
+
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+import logging
+import time
+
+from settings import settings
+
+
+@dataclass
+class RequestDBStats:
+    queries: int = 0
+    db_time: float = 0.0
+    pool_wait: float = 0.0
+
+
+# статистика текущего запроса; объект общий для всех задач и greenlet'ов запроса
+_request_stats: ContextVar[Optional[RequestDBStats]] = ContextVar("request_db_stats", default=None)
+
+
+@dataclass
+class PoolWaitStats:
+    checkouts: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+
+POOL_WAIT = PoolWaitStats()
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """
+    Пул, который замеряет ожидание свободного соединения при checkout.
+    """
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - t0
+            POOL_WAIT.checkouts += 1
+            POOL_WAIT.total += waited
+            POOL_WAIT.max = max(POOL_WAIT.max, waited)
+            stats = _request_stats.get()
+            if stats is not None:
+                stats.pool_wait += waited
+
+
+def instrument(engine: AsyncEngine):
+    """
+    Считает запросы и время в БД для текущего HTTP-запроса (см. db_budget_middleware).
+    """
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_start"] = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += time.perf_counter() - conn.info.pop("query_start", time.perf_counter())
+
+
+async def db_budget_middleware(request: Request, call_next):
+    stats = RequestDBStats()
+    token = _request_stats.set(stats)
+    try:
+        response = await call_next(request)
+    finally:
+        _request_stats.reset(token)
+
+    db_ms = stats.db_time * 1000
+    wait_ms = stats.pool_wait * 1000
+    response.headers["X-DB-Queries"] = str(stats.queries)
+    response.headers["Server-Timing"] = f"db;dur={db_ms:.1f}, db-pool-wait;dur={wait_ms:.1f}"
+
+    if stats.queries > settings.DB_QUERY_BUDGET or db_ms > settings.DB_TIME_BUDGET_MS:
+        logging.warning(
+            f"DB budget exceeded: {request.method} {request.url.path} "
+            f"queries={stats.queries}/{settings.DB_QUERY_BUDGET} "
+            f"db_time={db_ms:.1f}ms/{settings.DB_TIME_BUDGET_MS}ms pool_wait={wait_ms:.1f}ms"
+        )
+    return response
@@ -3,7 +3,9 @@ from sqlalchemy import (
     DateTime,
     Enum as SAEnum,
     ForeignKey,
+    Index,
     Integer,
+    LargeBinary,
     String,
     func,
 )
@@ -18,6 +20,8 @@ Base = declarative_base()
 class MessageRole(str, Enum):
     USER = "user"
     AI = "ai"
+    # одна строка-сводка вместо сообщений чата, ушедших в архив (см. database/retention.py)
+    SUMMARY = "summary"
 
 class User(Base):
     __tablename__ = "users"
@@ -55,10 +59,10 @@ class ChatMessage(Base):
     __tablename__ = "chat_messages"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    # отдельный индекс по chat_id не нужен: его покрывает ix_chat_messages_chat_history
     chat_id: Mapped[int] = mapped_column(
         ForeignKey("chats.id", ondelete="CASCADE"),
         nullable=False,
-        index=True,
     )
 
     role: Mapped[MessageRole] = mapped_column(
@@ -77,6 +81,33 @@ class ChatMessage(Base):
     )
 
     chat: Mapped[Chat] = relationship("Chat", back_populates="messages")
+
+    __table_args__ = (
+        # покрывает выборку истории: WHERE chat_id = ? ORDER BY created_at, id
+        Index("ix_chat_messages_chat_history", "chat_id", "created_at", "id"),
+    )
+
+
+class ChatArchive(Base):
+    __tablename__ = "chat_archives"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    chat_id: Mapped[int] = mapped_column(
+        ForeignKey("chats.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    message_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    first_message_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    last_message_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    # zlib(JSON) со списком {"role", "content", "created_at"}
+    transcript: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
     
     
 class Delivery(Base):
@@ -0,0 +1,550 @@
+"""
+Хранение истории чатов: компактизация неактивных чатов и секционирование chat_messages.
+
+Чат, в котором не было сообщений дольше `RETENTION_IDLE_DAYS`, сворачивается в одну
+строку-сводку (роль SUMMARY) в chat_messages и архив в chat_archives со сжатым
+транскриптом. Работа идёт пачками по `RETENTION_BATCH_SIZE` чатов, каждая пачка в
+своей короткой транзакции с lock_timeout: строки чатов блокируются через
+FOR UPDATE SKIP LOCKED, удаляются только сообщения, прочитанные в этой транзакции.
+
+    python -m backend.database.retention --migrate                # схема: роль SUMMARY, индексы, архив
+    python -m backend.database.retention --partition              # перевести chat_messages на помесячные секции
+    python -m backend.database.retention --idle-days 30 --vacuum --report  # компактизация + статистика до/после
+"""
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from backend.database import db, models
+from settings import settings
+
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import time
+import zlib
+
+
+SUMMARY_PREVIEW_CHARS = 300
+LOCK_TIMEOUT_MS = 2000
+PARTITIONED_TMP = "chat_messages_p"
+# последние id, которые дозаливаются и сверяются под эксклюзивной блокировкой
+SWAP_WINDOW_IDS = 10000
+SWAP_ATTEMPTS = 8
+PARTITION_CHECK_HOURS = 24
+INDEXES = (
+    ("ix_chat_messages_role", "role"),
+    ("ix_chat_messages_created_at", "created_at"),
+    ("ix_chat_messages_chat_history", "chat_id, created_at, id"),
+)
+
+
+# ----------------------------
+# Компактизация
+# ----------------------------
+
+def _preview(text_: str) -> str:
+    text_ = " ".join(text_.split())
+    return text_ if len(text_) <= SUMMARY_PREVIEW_CHARS else text_[: SUMMARY_PREVIEW_CHARS - 1] + "…"
+
+
+def build_summary(rows: List[models.ChatMessage]) -> str:
+    """
+    Экстрактивная сводка без вызова LLM: объём, период, первый и последний запрос, последний ответ.
+    """
+    users = [r for r in rows if r.role == models.MessageRole.USER]
+    replies = [r for r in rows if r.role == models.MessageRole.AI and r.content]
+    earlier = [r for r in rows if r.role == models.MessageRole.SUMMARY]
+
+    parts = [f"{len(rows)} messages from {rows[0].created_at:%Y-%m-%d} to {rows[-1].created_at:%Y-%m-%d}."]
+    if earlier:
+        parts.append(f"Earlier: {_preview(earlier[-1].content)}")
+    if users:
+        parts.append(f"First request: {_preview(users[0].content)}")
+    if len(users) > 1:
+        parts.append(f"Last request: {_preview(users[-1].content)}")
+    if replies:
+        parts.append(f"Last reply: {_preview(replies[-1].content)}")
+    return " ".join(parts)
+
+
+def pack_transcript(rows: List[models.ChatMessage]) -> bytes:
+    payload = [
+        {"role": r.role.value, "content": r.content, "created_at": r.created_at.isoformat()}
+        for r in rows
+    ]
+    return zlib.compress(json.dumps(payload, ensure_ascii=False).encode("utf-8"), 9)
+
+
+def unpack_transcript(blob: bytes) -> list:
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+async def _idle_chat_ids(session: AsyncSession, cutoff: datetime, after_id: int, limit: int) -> List[int]:
+    """
+    Следующая страница неактивных чатов по chats.id. Последнее сообщение и наличие
+    второго ищутся по индексу истории для каждого чата, без агрегата по всей chat_messages.
+    """
+    msg = models.ChatMessage
+    last_at = select(func.max(msg.created_at)).where(msg.chat_id == models.Chat.id).scalar_subquery()
+    second = (
+        select(msg.id)
+        .where(msg.chat_id == models.Chat.id)
+        .offset(1)
+        .limit(1)
+        .exists()
+    )
+    res = await session.execute(
+        select(models.Chat.id)
+        .where(models.Chat.id > after_id, last_at < cutoff, second)
+        .order_by(models.Chat.id)
+        .limit(limit)
+    )
+    return list(res.scalars())
+
+
+def _is_lock_timeout(error: DBAPIError) -> bool:
+    code = getattr(error.orig, "sqlstate", None) or getattr(error.orig, "pgcode", None)
+    return code == "55P03"
+
+
+async def compact_chat(session: AsyncSession, chat_id: int, cutoff: datetime) -> int:
+    """
+    Возвращает число освобождённых строк chat_messages. Чат, в котором появилось
+    сообщение после выборки кандидатов, не трогаем.
+    """
+    res = await session.execute(
+        select(models.ChatMessage)
+        .where(models.ChatMessage.chat_id == chat_id)
+        .order_by(models.ChatMessage.created_at.asc(), models.ChatMessage.id.asc())
+    )
+    rows = list(res.scalars())
+    if len(rows) < 2 or rows[-1].created_at >= cutoff:
+        return 0
+
+    session.add(
+        models.ChatArchive(
+            chat_id=chat_id,
+            message_count=len(rows),
+            first_message_at=rows[0].created_at,
+            last_message_at=rows[-1].created_at,
+            transcript=pack_transcript(rows),
+        )
+    )
+    # created_at сводки = последнее сообщение, чтобы чат не выглядел активным
+    session.add(
+        models.ChatMessage(
+            chat_id=chat_id,
+            role=models.MessageRole.SUMMARY,
+            content=build_summary(rows),
+            created_at=rows[-1].created_at,
+        )
+    )
+    await session.execute(
+        delete(models.ChatMessage).where(models.ChatMessage.id.in_([r.id for r in rows]))
+    )
+    return len(rows) - 1
+
+
+async def compact_idle_chats(
+    idle_days: int = settings.RETENTION_IDLE_DAYS,
+    batch_size: int = settings.RETENTION_BATCH_SIZE,
+    max_batches: Optional[int] = None,
+    pause: float = settings.RETENTION_PAUSE_SECONDS,
+) -> dict:
+    cutoff = datetime.now(timezone.utc) - timedelta(days=idle_days)
+    stats = {"batches": 0, "chats": 0, "rows_reclaimed": 0, "skipped_batches": 0}
+    after_id = 0
+
+    while max_batches is None or stats["batches"] < max_batches:
+        async with db.new_session() as session:
+            chat_ids = await _idle_chat_ids(session, cutoff, after_id, batch_size)
+            if not chat_ids:
+                break
+            # курсор сдвигается и для пропущенных чатов: они достанутся следующему запуску
+            after_id = chat_ids[-1]
+
+            try:
+                # не ждём чужие блокировки: лучше пропустить пачку, чем встать в очередь
+                await session.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT_MS}ms'"))
+                locked = (
+                    await session.execute(
+                        select(models.Chat.id)
+                        .where(models.Chat.id.in_(chat_ids))
+                        .with_for_update(skip_locked=True)
+                    )
+                ).scalars().all()
+
+                reclaimed = 0
+                for chat_id in locked:
+                    reclaimed += await compact_chat(session, chat_id, cutoff)
+                await session.commit()
+            except DBAPIError as e:
+                if not _is_lock_timeout(e):
+                    raise
+                await session.rollback()
+                logging.warning(f"Chat retention: lock timeout, skipping chats {chat_ids[0]}..{after_id}")
+                stats["skipped_batches"] += 1
+                locked, reclaimed = [], 0
+
+        stats["batches"] += 1
+        stats["chats"] += len(locked)
+        stats["rows_reclaimed"] += reclaimed
+        await asyncio.sleep(pause)
+
+    return stats
+
+
+# ----------------------------
+# Статистика
+# ----------------------------
+
+async def table_stats(session: AsyncSession, chat_ids: List[int], repeats: int = 5) -> dict:
+    from backend.agent.utils import fetch_chat_messages_raw
+
+    # reltuples вместо count(*): оценка из последнего ANALYZE, без прохода по таблице
+    size, rows = (
+        await session.execute(
+            text(
+                "SELECT coalesce(sum(pg_total_relation_size(t.relid)), 0), "
+                "coalesce(sum(greatest(c.reltuples, 0)) FILTER (WHERE t.isleaf), 0) "
+                "FROM pg_partition_tree('chat_messages') t JOIN pg_class c ON c.oid = t.relid"
+            )
+        )
+    ).one()
+
+    timings = []
+    for chat_id in chat_ids:
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            await fetch_chat_messages_raw(session, chat_id)
+            timings.append((time.perf_counter() - t0) * 1000)
+
+    return {
+        "table_bytes": int(size or 0),
+        "rows_estimate": int(rows or 0),
+        "history_ms_p50": statistics.median(timings) if timings else None,
+    }
+
+
+async def _sample_chat_ids(session: AsyncSession, sample: int) -> List[int]:
+    """
+    Самые длинные чаты — GROUP BY по всей chat_messages, поэтому только для отчёта из CLI.
+    """
+    res = await session.execute(
+        select(models.ChatMessage.chat_id)
+        .group_by(models.ChatMessage.chat_id)
+        .order_by(func.count().desc())
+        .limit(sample)
+    )
+    return list(res.scalars())
+
+
+async def _autocommit() -> AsyncConnection:
+    conn = await db.engine.connect()
+    return await conn.execution_options(isolation_level="AUTOCOMMIT")
+
+
+async def vacuum():
+    # обычный VACUUM не блокирует чтение и запись, в отличие от VACUUM FULL
+    conn = await _autocommit()
+    try:
+        await conn.execute(text("VACUUM (ANALYZE) chat_messages"))
+    finally:
+        await conn.close()
+
+
+# ----------------------------
+# Схема и секционирование (Postgres)
+# ----------------------------
+
+async def ensure_schema():
+    """
+    Доводит существующую базу до текущих моделей без drop_all: новая роль, архив, индекс истории.
+    """
+    conn = await _autocommit()
+    try:
+        # SAEnum хранит имена членов перечисления
+        await conn.execute(text("ALTER TYPE message_role ADD VALUE IF NOT EXISTS 'SUMMARY'"))
+        await conn.run_sync(models.Base.metadata.create_all, tables=[models.ChatArchive.__table__])
+
+        # у секционированной таблицы индексы уже созданы partition_chat_messages
+        relkind = await conn.scalar(text("SELECT relkind FROM pg_class WHERE oid = 'chat_messages'::regclass"))
+        if relkind != "p":
+            await conn.execute(
+                text(
+                    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chat_messages_chat_history "
+                    "ON chat_messages (chat_id, created_at, id)"
+                )
+            )
+            # его покрывает составной индекс истории
+            await conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS ix_chat_messages_chat_id"))
+    finally:
+        await conn.close()
+
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _next_month(day: date) -> date:
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+async def ensure_partitions(conn: AsyncConnection, parent: str, start: date, months_ahead: int):
+    month = _month_start(start)
+    end = _month_start(datetime.now(timezone.utc).date())
+    for _ in range(months_ahead):
+        end = _next_month(end)
+
+    while month <= end:
+        upper = _next_month(month)
+        await conn.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS chat_messages_y{month:%Y}m{month:%m} PARTITION OF {parent} "
+                f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{upper.isoformat()} 00:00:00+00')"
+            )
+        )
+        month = upper
+    await conn.execute(text(f"CREATE TABLE IF NOT EXISTS chat_messages_default PARTITION OF {parent} DEFAULT"))
+
+
+async def _has_foreign_key(conn: AsyncConnection, table: str) -> bool:
+    return bool(
+        await conn.scalar(
+            text(
+                "SELECT EXISTS (SELECT 1 FROM pg_constraint "
+                "WHERE conrelid = CAST(:table AS regclass) AND contype = 'f')"
+            ),
+            {"table": table},
+        )
+    )
+
+
+async def _catch_up(conn, after_id: int = 0) -> int:
+    """
+    Дозаливает строки с id > after_id, которых ещё нет в новой таблице. Возвращает число вставленных.
+    """
+    res = await conn.execute(
+        text(
+            f"INSERT INTO {PARTITIONED_TMP} SELECT m.* FROM chat_messages m "
+            f"WHERE m.id > :after_id AND NOT EXISTS (SELECT 1 FROM {PARTITIONED_TMP} p WHERE p.id = m.id)"
+        ),
+        {"after_id": after_id},
+    )
+    return res.rowcount
+
+
+async def partition_chat_messages(
+    months_ahead: int = 3,
+    batch_size: int = 10000,
+    window: int = SWAP_WINDOW_IDS,
+    attempts: int = SWAP_ATTEMPTS,
+):
+    """
+    Переводит chat_messages на помесячные секции по created_at.
+
+    Всё тяжёлое идёт без блокировки таблицы: внешний ключ создаётся на пустой новой
+    таблице, основной объём копируется пачками по id, затем один проход дозаливает
+    строки, закоммиченные не по порядку id. Под эксклюзивной блокировкой остаются
+    только последние `window` id: id выдаются раньше коммита, и окно должно покрывать
+    id, выданные за время самой долгой пишущей транзакции. В нём дозаливаются строки
+    и сверяется их число. Блокировку ждём не дольше lock_timeout и повторяем с паузой.
+    Задачу компактизации на это время нужно остановить.
+    """
+    conn = await _autocommit()
+    try:
+        relkind = await conn.scalar(text("SELECT relkind FROM pg_class WHERE oid = 'chat_messages'::regclass"))
+        if relkind == "p":
+            await ensure_partitions(conn, "chat_messages", datetime.now(timezone.utc).date(), months_ahead)
+            return
+
+        await conn.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {PARTITIONED_TMP} ("
+                "LIKE chat_messages INCLUDING DEFAULTS INCLUDING CONSTRAINTS, "
+                "PRIMARY KEY (id, created_at)"
+                ") PARTITION BY RANGE (created_at)"
+            )
+        )
+        oldest = await conn.scalar(text("SELECT min(created_at) FROM chat_messages"))
+        start = oldest.date() if oldest else datetime.now(timezone.utc).date()
+        await ensure_partitions(conn, PARTITIONED_TMP, start, months_ahead)
+
+        # индексы и внешний ключ — до копирования: на пустой таблице проверять нечего,
+        # а под блокировкой индексы только переименовываются
+        for name, columns in INDEXES:
+            await conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name}_p ON {PARTITIONED_TMP} ({columns})"))
+        if not await _has_foreign_key(conn, PARTITIONED_TMP):
+            await conn.execute(
+                text(
+                    f"ALTER TABLE {PARTITIONED_TMP} ADD FOREIGN KEY (chat_id) "
+                    "REFERENCES chats (id) ON DELETE CASCADE"
+                )
+            )
+
+        last_id = await conn.scalar(text(f"SELECT coalesce(max(id), 0) FROM {PARTITIONED_TMP}"))
+        while (moved := await _copy_batch(conn, last_id, batch_size)) is not None:
+            last_id = moved
+            await asyncio.sleep(settings.RETENTION_PAUSE_SECONDS)
+
+        caught_up = await _catch_up(conn)
+        logging.info(f"Chat partitioning: copied up to id {last_id}, caught up {caught_up} rows")
+        high_water = await conn.scalar(text(f"SELECT coalesce(max(id), 0) FROM {PARTITIONED_TMP}"))
+    finally:
+        await conn.close()
+
+    after_id = max(high_water - window, 0)
+    for attempt in range(attempts):
+        try:
+            await _swap(after_id)
+            return
+        except DBAPIError as e:
+            if not _is_lock_timeout(e) or attempt == attempts - 1:
+                raise
+            delay = min(2 ** attempt, 60)
+            logging.warning(f"Chat partitioning: chat_messages is busy, retrying swap in {delay}s")
+            await asyncio.sleep(delay)
+
+
+async def _swap(after_id: int):
+    async with db.engine.begin() as tx:
+        await tx.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT_MS}ms'"))
+        await tx.execute(text("LOCK TABLE chat_messages IN ACCESS EXCLUSIVE MODE"))
+        await _catch_up(tx, after_id)
+
+        count = "SELECT count(*) FROM {} WHERE id > :after_id"
+        old_rows = await tx.scalar(text(count.format("chat_messages")), {"after_id": after_id})
+        new_rows = await tx.scalar(text(count.format(PARTITIONED_TMP)), {"after_id": after_id})
+        if old_rows != new_rows:
+            raise RuntimeError(
+                f"chat_messages has {old_rows} rows with id > {after_id}, {PARTITIONED_TMP} has {new_rows}; not swapping"
+            )
+
+        await tx.execute(text(f"ALTER SEQUENCE chat_messages_id_seq OWNED BY {PARTITIONED_TMP}.id"))
+        await tx.execute(text("DROP TABLE chat_messages"))
+        await tx.execute(text(f"ALTER TABLE {PARTITIONED_TMP} RENAME TO chat_messages"))
+        for name, _ in INDEXES:
+            await tx.execute(text(f"ALTER INDEX {name}_p RENAME TO {name}"))
+
+
+async def _copy_batch(conn: AsyncConnection, last_id: int, batch_size: int) -> Optional[int]:
+    return await conn.scalar(
+        text(
+            f"WITH moved AS (INSERT INTO {PARTITIONED_TMP} "
+            "SELECT * FROM chat_messages WHERE id > :last_id ORDER BY id LIMIT :batch_size "
+            "RETURNING id) SELECT max(id) FROM moved"
+        ),
+        {"last_id": last_id, "batch_size": batch_size},
+    )
+
+
+# ----------------------------
+# Запуск
+# ----------------------------
+
+async def maintain_partitions(months_ahead: int = 3):
+    """
+    Создаёт секции на ближайшие месяцы. Без них новые строки уходят в
+    chat_messages_default, и секцию за этот месяц потом создать уже нельзя.
+    """
+    conn = await _autocommit()
+    try:
+        relkind = await conn.scalar(text("SELECT relkind FROM pg_class WHERE oid = 'chat_messages'::regclass"))
+        if relkind == "p":
+            await ensure_partitions(conn, "chat_messages", datetime.now(timezone.utc).date(), months_ahead)
+    finally:
+        await conn.close()
+
+
+async def partition_loop(interval_hours: float = PARTITION_CHECK_HOURS):
+    # отдельно от компактизации: секции нужны, даже когда фоновая компактизация выключена
+    while True:
+        try:
+            await maintain_partitions()
+        except Exception as e:
+            logging.error(f"Chat partition maintenance failed: {e}")
+        await asyncio.sleep(interval_hours * 3600)
+
+
+async def run_retention(
+    idle_days: int = settings.RETENTION_IDLE_DAYS,
+    batch_size: int = settings.RETENTION_BATCH_SIZE,
+    max_batches: Optional[int] = None,
+    run_vacuum: bool = False,
+    report: bool = False,
+    chat_ids: Optional[List[int]] = None,
+    sample: int = 20,
+) -> dict:
+    """
+    `report` добавляет статистику до и после. Без `chat_ids` выборка чатов для замера
+    истории идёт GROUP BY по всей таблице, поэтому фоновая задача отчёт не собирает.
+    """
+    before = after = None
+    if report:
+        async with db.new_session() as session:
+            if chat_ids is None:
+                chat_ids = await _sample_chat_ids(session, sample)
+            before = await table_stats(session, chat_ids)
+
+    compaction = await compact_idle_chats(idle_days, batch_size, max_batches)
+    if run_vacuum:
+        await vacuum()
+
+    if report:
+        async with db.new_session() as session:
+            after = await table_stats(session, chat_ids)
+
+    result = {"compaction": compaction}
+    if report:
+        result.update(before=before, after=after)
+    logging.info(f"Chat retention: {json.dumps(result)}")
+    return result
+
+
+async def retention_loop(interval_minutes: float):
+    while True:
+        try:
+            await run_retention()
+        except Exception as e:
+            logging.error(f"Chat retention failed: {e}")
+        await asyncio.sleep(interval_minutes * 60)
+
+
+async def _main(args):
+    try:
+        if args.migrate:
+            await ensure_schema()
+        if args.partition:
+            await partition_chat_messages(months_ahead=args.months_ahead)
+        report = await run_retention(
+            idle_days=args.idle_days,
+            batch_size=args.batch_size,
+            max_batches=args.max_batches,
+            run_vacuum=args.vacuum,
+            report=args.report,
+            chat_ids=args.chat_ids,
+        )
+        print(json.dumps(report, indent=2))
+    finally:
+        await db.engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact idle chats and maintain chat_messages partitions")
+    parser.add_argument("--idle-days", type=int, default=settings.RETENTION_IDLE_DAYS)
+    parser.add_argument("--batch-size", type=int, default=settings.RETENTION_BATCH_SIZE)
+    parser.add_argument("--max-batches", type=int, default=None)
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM (ANALYZE) после компактизации")
+    parser.add_argument("--report", action="store_true", help="Размер таблицы и задержка истории до/после")
+    parser.add_argument(
+        "--chat-ids", type=int, nargs="+", default=None, help="Чаты для замера истории (иначе самые длинные)"
+    )
+    parser.add_argument("--migrate", action="store_true", help="Добавить роль SUMMARY, chat_archives и индекс истории")
+    parser.add_argument("--partition", action="store_true", help="Секционировать chat_messages по месяцам")
+    parser.add_argument("--months-ahead", type=int, default=3)
+    asyncio.run(_main(parser.parse_args()))
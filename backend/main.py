@@ -1,9 +1,9 @@
 from fastapi import FastAPI
 from backend.api.router import api
-from backend.agent.router import agent, limiter
 from backend.auth.router import router as auth_router
 
-from backend.database import db, models
+from backend.database import db, models, metrics
+from settings import settings
 
 from contextlib import asynccontextmanager
 from typing import Annotated
@@ -11,20 +11,62 @@ from typing import Annotated
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 
+import asyncio
+import logging
+
+
+def _log_warmup_result(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logging.error(f"Agent warm-up failed: {task.exception()}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup: setup database
-    
-    await db.setup_database()
+    if settings.SETUP_DB_ON_STARTUP:
+        await db.setup_database()
+        if settings.CHAT_PARTITIONING:
+            from backend.database.retention import partition_chat_messages
+
+            # таблица только что создана и пуста — переключение мгновенное
+            await partition_chat_messages()
+
+    # Прогрев агента в фоне: сервер начинает принимать запросы сразу,
+    # а тяжёлые импорты и загрузка эмбеддингов идут параллельно
+    warmup_task = None
+    if settings.ENABLE_AGENT and settings.AGENT_WARMUP:
+        from backend.agent.utils import warm_up_agent
+
+        warmup_task = asyncio.create_task(asyncio.to_thread(warm_up_agent))
+        warmup_task.add_done_callback(_log_warmup_result)
+
+    retention_task = None
+    if settings.RETENTION_INTERVAL_MINUTES > 0:
+        from backend.database.retention import retention_loop
+
+        retention_task = asyncio.create_task(retention_loop(settings.RETENTION_INTERVAL_MINUTES))
+
+    partition_task = None
+    if settings.CHAT_PARTITIONING:
+        from backend.database.retention import partition_loop
+
+        partition_task = asyncio.create_task(partition_loop())
     yield
     # Shutdown: any cleanup can be done here
+    for task in (warmup_task, retention_task, partition_task):
+        if task is not None and not task.done():
+            task.cancel()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+app.middleware("http")(metrics.db_budget_middleware)
 app.include_router(api)
 
-app.include_router(agent)
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+if settings.ENABLE_AGENT:
+    from backend.agent.router import agent, limiter
+
+    app.include_router(agent)
+    app.state.limiter = limiter
+    app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
 app.include_router(auth_router)
 
@@ -38,4 +80,22 @@ async def setup_database():
         return {"status": "Database setup completed successfully."}
     except Exception as e:
         return {"status": "Database setup failed.", "error": str(e)}
-    
+
+
+@app.get("/db_stats")
+async def db_stats():
+    pool = db.engine.pool
+    wait = metrics.POOL_WAIT
+    return {
+        "profile": settings.DB_PROFILE,
+        "pool": {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+        },
+        "pool_wait": {
+            "checkouts": wait.checkouts,
+            "avg_ms": wait.total / wait.checkouts * 1000 if wait.checkouts else 0.0,
+            "max_ms": wait.max * 1000,
+        },
+    }
@@ -0,0 +1,108 @@
+"""
+Профиль холодного старта: время импорта и базовый RSS процесса API.
+
+Каждый сценарий запускается в чистом интерпретаторе. Кроме итоговой таблицы печатаются
+самые дорогие модули по `python -X importtime`.
+
+    python -m bench.cold_start
+    python -m bench.cold_start --top 25 --json cold_start.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+from tabulate import tabulate
+
+
+# (название, импортируемый модуль, переменные окружения)
+SCENARIOS = [
+    ("api-only", "backend.main", {"ENABLE_AGENT": "0"}),
+    ("api+agent (lazy)", "backend.main", {"ENABLE_AGENT": "1"}),
+    ("agent graph", "agent.main", {}),
+    ("agent warm", "backend.agent.utils:warm_up_agent", {}),
+]
+
+PROBE = """
+import importlib, json, time, psutil
+t0 = time.perf_counter()
+module, _, func = {target!r}.partition(":")
+mod = importlib.import_module(module)
+if func:
+    getattr(mod, func)()
+elapsed = time.perf_counter() - t0
+print(json.dumps({{"import_s": elapsed, "rss_mb": psutil.Process().memory_info().rss / 2**20}}))
+"""
+
+
+def probe(target: str, env: Dict[str, str]) -> Dict:
+    proc = subprocess.run(
+        [sys.executable, "-c", PROBE.format(target=target)],
+        env={**os.environ, **env},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def import_profile(target: str, env: Dict[str, str], top: int) -> List[Dict]:
+    """
+    Разбирает вывод `-X importtime` (stderr) и возвращает самые тяжёлые модули верхнего уровня.
+    """
+    module = target.partition(":")[0]
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env={**os.environ, **env},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        self_us, cumulative_us, name = fields
+        # вложенные импорты выводятся с отступом, оставляем только верхний уровень
+        name = name[1:]
+        if name.startswith(" "):
+            continue
+        rows.append({"module": name, "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+    rows.sort(key=lambda r: r["cumulative_ms"], reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start import-time and memory profile")
+    parser.add_argument("--top", type=int, default=15, help="Сколько модулей показать в профиле импорта")
+    parser.add_argument("--json", type=Path, help="Сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    results = []
+    for name, target, env in SCENARIOS:
+        try:
+            row = {"scenario": name, "target": target, **probe(target, env)}
+        except subprocess.CalledProcessError as e:
+            row = {"scenario": name, "target": target, "error": e.stderr.strip().splitlines()[-1]}
+        results.append(row)
+
+    print(tabulate(results, headers="keys", floatfmt=".3f"))
+
+    profiles = {}
+    for name, target, env in SCENARIOS[:3]:
+        profiles[name] = import_profile(target, env, args.top)
+        print(f"\nSlowest top-level imports: {name}")
+        print(tabulate(profiles[name], headers="keys", floatfmt=".1f"))
+
+    if args.json:
+        args.json.write_text(json.dumps({"scenarios": results, "imports": profiles}, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
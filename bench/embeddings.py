@@ -0,0 +1,110 @@
+"""
+Сравнение бэкендов эмбеддингов: совпадение с PyTorch-векторами, латентность и RSS.
+
+Каждый бэкенд запускается в отдельном процессе, чтобы RSS не учитывал torch,
+загруженный для соседнего бэкенда.
+
+    python -m agent.embeddings --quantize        # один раз, экспорт ONNX
+    python -m bench.embeddings --backends torch onnx onnx-int8 --tolerance 0.99
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from tabulate import tabulate
+
+from agent.embeddings import BACKENDS, make_embeddings
+from agent.rag import load_documents
+from bench.retrieval import load_queries, percentile, rss_mb
+from settings import settings
+
+
+def measure(model_name: str, backend: str, repeats: int) -> Dict:
+    rss_start = rss_mb()
+    t0 = time.perf_counter()
+    embeddings = make_embeddings(model_name, backend=backend)
+    load_s = time.perf_counter() - t0
+
+    queries = [q["query"] for q in load_queries()]
+    documents = [d.page_content for d in load_documents()]
+
+    embeddings.embed_query("warm-up")
+
+    query_ms: List[float] = []
+    for _ in range(repeats):
+        for text in queries:
+            t0 = time.perf_counter()
+            embeddings.embed_query(text)
+            query_ms.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    doc_vectors = embeddings.embed_documents(documents)
+    docs_s = time.perf_counter() - t0
+
+    return {
+        "backend": backend,
+        "load_s": load_s,
+        "query_ms_p50": statistics.median(query_ms),
+        "query_ms_p95": percentile(query_ms, 0.95),
+        "docs_per_s": len(documents) / docs_s,
+        "rss_mb": rss_mb(),
+        "rss_growth_mb": rss_mb() - rss_start,
+        "vectors": [embeddings.embed_query(q) for q in queries] + doc_vectors,
+    }
+
+
+def cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm_a = sum(x * x for x in a) ** 0.5
+    norm_b = sum(y * y for y in b) ** 0.5
+    return dot / (norm_a * norm_b)
+
+
+def run_isolated(model_name: str, backend: str, repeats: int) -> Dict:
+    proc = subprocess.run(
+        [sys.executable, "-m", "bench.embeddings", "--worker", backend,
+         "--model", model_name, "--repeats", str(repeats)],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding backend parity and latency benchmark")
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=0.99, help="Минимальный косинус к torch-вектору")
+    parser.add_argument("--worker", choices=BACKENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(args.model, args.worker, args.repeats)))
+        return
+
+    results = {backend: run_isolated(args.model, backend, args.repeats) for backend in args.backends}
+    reference = (results.get("torch") or run_isolated(args.model, "torch", 1))["vectors"]
+
+    rows, failed = [], []
+    for backend, result in results.items():
+        sims = [cosine(a, b) for a, b in zip(result.pop("vectors"), reference)]
+        result["cos_min"] = min(sims)
+        result["cos_mean"] = statistics.mean(sims)
+        if result["cos_min"] < args.tolerance:
+            failed.append(backend)
+        rows.append(result)
+
+    print(tabulate(rows, headers="keys", floatfmt=".4f"))
+    if failed:
+        print(f"Cosine similarity below {args.tolerance} for: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
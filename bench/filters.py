@@ -0,0 +1,72 @@
+"""
+Латентность и размер результата поиска для разных комбинаций фильтров по метаданным.
+
+    python -m bench.filters --repeats 10
+"""
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+
+from tabulate import tabulate
+
+from agent.rag import RAG
+from bench.retrieval import load_queries, percentile
+
+
+# (название, фильтры) — покрывают все поля, которые может передать модель
+COMBINATIONS = [
+    ("none", {}),
+    ("source=menu", {"source": "menu"}),
+    ("source=review", {"source": "review"}),
+    ("category=pizza", {"source": "menu", "category": "pizza"}),
+    ("rating>=4", {"source": "review", "min_rating": 4}),
+    ("rating<=2", {"source": "review", "max_rating": 2}),
+    ("2024-03", {"date_from": "2024-03-01", "date_to": "2024-03-31"}),
+    ("rating<=2 & 2024-02", {"max_rating": 2, "date_from": "2024-02-01", "date_to": "2024-02-29"}),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Metadata-filtered retrieval benchmark")
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--json", type=Path, help="Сохранить строки таблицы в JSON")
+    args = parser.parse_args()
+
+    rag = RAG(k=args.k)
+    queries = [q["query"] for q in load_queries()]
+    rag.search("warm-up")
+
+    rows = []
+    for name, filters in COMBINATIONS:
+        latencies, sizes, chars = [], [], []
+        for _ in range(args.repeats):
+            for query in queries:
+                t0 = time.perf_counter()
+                docs = rag.search(query, **filters)
+                latencies.append((time.perf_counter() - t0) * 1000)
+                sizes.append(len(docs))
+                chars.append(sum(len(d.page_content) for d in docs))
+
+        rows.append(
+            {
+                "filters": name,
+                "candidates": rag.count(**filters),
+                "search_ms_p50": statistics.median(latencies),
+                "search_ms_p95": percentile(latencies, 0.95),
+                "results_avg": statistics.mean(sizes),
+                "result_chars_avg": statistics.mean(chars),
+                # грубая оценка: ~4 символа на токен для английского текста
+                "result_tokens_avg": statistics.mean(chars) / 4,
+            }
+        )
+
+    print(tabulate(rows, headers="keys", floatfmt=".2f"))
+    if args.json:
+        args.json.write_text(json.dumps(rows, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
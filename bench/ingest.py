@@ -0,0 +1,173 @@
+"""
+Потоковая загрузка отзывов против прежней загрузки целиком в память: строки в секунду
+и пиковый RSS на синтетических выгрузках заданного размера. Каждый прогон идёт в
+отдельном процессе с чистым индексом, чтобы пиковый RSS не смешивался.
+
+`--fake-embeddings` заменяет модель детерминированными векторами и меряет сам конвейер
+(чтение, нормализация, чанки, запись в Chroma); без флага миллион строк на CPU
+эмбеддится часами.
+
+    python -m bench.ingest --sizes 10000 100000 1000000 --fake-embeddings
+"""
+import argparse
+import csv
+import json
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from tabulate import tabulate
+
+from settings import settings
+
+
+WORDS = (
+    "pizza crust sauce cheese delivery service staff wait price pepperoni margherita basil oven "
+    "crispy soggy friendly slow fast warm cold table order garlic wings dessert value loud cozy"
+).split()
+
+# ниже предела Chroma на один вызов add/upsert
+LEGACY_WRITE_BATCH = 5000
+
+
+def make_csv(path: Path, rows: int, seed: int = 0):
+    """
+    Отзывы примерно от 50 до 1300 символов (часть режется на чанки), даты за пять лет, оценки 1–5.
+    """
+    rng = random.Random(seed)
+    with path.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Title", "Date", "Rating", "Review"])
+        for i in range(rows):
+            words = rng.choices(WORDS, k=rng.randint(8, 200))
+            writer.writerow(
+                [
+                    f"{rng.choice(WORDS).title()} {rng.choice(WORDS)} #{i}",
+                    f"{rng.randint(2020, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                    rng.randint(1, 5),
+                    " ".join(words).capitalize() + ".",
+                ]
+            )
+
+
+def get_embeddings(fake: bool):
+    if fake:
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+
+        return DeterministicFakeEmbedding(size=384)
+    from agent.embeddings import make_embeddings
+
+    return make_embeddings(settings.EMBEDDING_MODEL)
+
+
+def run_streaming(args) -> dict:
+    from agent.ingest import ingest_reviews
+
+    stats = ingest_reviews(
+        args.csv,
+        persist_dir=args.persist_dir,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        restart=True,
+        embeddings=get_embeddings(args.fake_embeddings),
+    )
+    return {"chunks": stats["chunks"], "seconds": stats["seconds"]}
+
+
+def run_legacy(args) -> dict:
+    """
+    Прежний путь: все документы в списке, один проход эмбеддинга, затем запись.
+    """
+    from agent.ingest import get_collection
+    from agent.rag import load_documents
+
+    embeddings = get_embeddings(args.fake_embeddings)
+    collection = get_collection(args.persist_dir)
+
+    t0 = time.perf_counter()
+    docs = load_documents(args.csv.parent)
+    texts = [d.page_content for d in docs]
+    vectors = embeddings.embed_documents(texts)
+    ids = [str(i) for i in range(len(docs))]
+    for start in range(0, len(docs), LEGACY_WRITE_BATCH):
+        end = start + LEGACY_WRITE_BATCH
+        collection.upsert(
+            ids=ids[start:end],
+            embeddings=vectors[start:end],
+            metadatas=[d.metadata for d in docs[start:end]],
+            documents=texts[start:end],
+        )
+    return {"chunks": len(docs), "seconds": round(time.perf_counter() - t0, 2)}
+
+
+def child(args):
+    result = run_legacy(args) if args.mode == "legacy" else run_streaming(args)
+    # ru_maxrss в Linux — килобайты
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps(result))
+
+
+def run(args):
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            data_dir = Path(tmp) / str(size)
+            data_dir.mkdir()
+            # имя как у встроенного файла, чтобы прежний путь прочитал его через load_documents
+            csv_path = data_dir / "restaurant_reviews.csv"
+            make_csv(csv_path, size)
+
+            modes = ["streaming"] + (["legacy"] if size <= args.legacy_max else [])
+            for mode in modes:
+                cmd = [
+                    sys.executable, "-m", "bench.ingest", "--child",
+                    "--mode", mode,
+                    "--csv", str(csv_path),
+                    "--persist-dir", str(data_dir / f"chroma-{mode}"),
+                    "--batch-size", str(args.batch_size),
+                    "--workers", str(args.workers),
+                ]
+                if args.fake_embeddings:
+                    cmd.append("--fake-embeddings")
+                out = subprocess.run(cmd, capture_output=True, text=True, check=True)
+                result = json.loads(out.stdout.strip().splitlines()[-1])
+                rows.append(
+                    {
+                        "mode": mode,
+                        "csv_rows": size,
+                        "chunks": result["chunks"],
+                        "seconds": result["seconds"],
+                        "rows_per_s": size / result["seconds"] if result["seconds"] else None,
+                        "peak_rss_mb": result["peak_rss_mb"],
+                    }
+                )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming review ingestion benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--fake-embeddings", action="store_true")
+    parser.add_argument(
+        "--legacy-max", type=int, default=100_000, help="Прежний путь запускается только до этого размера"
+    )
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", choices=["streaming", "legacy"], default="streaming", help=argparse.SUPPRESS)
+    parser.add_argument("--csv", type=Path, help=argparse.SUPPRESS)
+    parser.add_argument("--persist-dir", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+    print(tabulate(run(args), headers="keys", floatfmt=".1f"))
+
+
+if __name__ == "__main__":
+    main()
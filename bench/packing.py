@@ -0,0 +1,84 @@
+"""
+Токены на один вызов search_knowledge_base: прежний формат (top-k similarity, полный JSON
+с дублирующимися полями) против MMR + компактной упаковки с бюджетом.
+
+    python -m bench.packing --budget 600
+"""
+import argparse
+import json
+import statistics
+from pathlib import Path
+
+from tabulate import tabulate
+
+from agent.packing import count_tokens, pack_documents
+from agent.rag import RAG
+from bench.retrieval import load_queries
+
+
+def legacy_payload(docs) -> dict:
+    """
+    Формат ответа инструмента до упаковщика.
+    """
+    results = []
+    for doc in docs:
+        if doc.metadata.get("source") == "menu":
+            results.append(
+                {
+                    "type": "menu",
+                    "name": doc.metadata.get("name"),
+                    "category": doc.metadata.get("category"),
+                    "price_usd": doc.metadata.get("price"),
+                    "detail": doc.page_content,
+                }
+            )
+        else:
+            results.append(
+                {
+                    "type": "review",
+                    "title": doc.metadata.get("title"),
+                    "date": doc.metadata.get("date"),
+                    "rating": doc.metadata.get("rating"),
+                    "detail": doc.page_content,
+                }
+            )
+    return {"matches": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt tokens per knowledge search call, before/after packing")
+    parser.add_argument("--budget", type=int, default=None, help="По умолчанию settings.CONTEXT_TOKEN_BUDGET")
+    parser.add_argument("--json", type=Path, help="Сохранить построчные результаты в JSON")
+    args = parser.parse_args()
+
+    rag = RAG()
+    rows = []
+    for item in load_queries():
+        query = item["query"]
+        before_docs = rag.vectorstore.similarity_search(query, k=rag.k)
+        before = json.dumps(legacy_payload(before_docs), ensure_ascii=False)
+
+        after_docs = rag.search(query)
+        after = json.dumps(pack_documents(after_docs, args.budget), ensure_ascii=False, separators=(",", ":"))
+
+        rows.append(
+            {
+                "query": query[:40],
+                "tokens_before": count_tokens(before),
+                "tokens_after": count_tokens(after),
+                "docs_before": len(before_docs),
+                "docs_after": len(json.loads(after)["matches"]),
+            }
+        )
+
+    print(tabulate(rows, headers="keys"))
+    before_avg = statistics.mean(r["tokens_before"] for r in rows)
+    after_avg = statistics.mean(r["tokens_after"] for r in rows)
+    print(f"\nmean tokens per call: {before_avg:.0f} -> {after_avg:.0f} ({1 - after_avg / before_avg:.0%} fewer)")
+
+    if args.json:
+        args.json.write_text(json.dumps(rows, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
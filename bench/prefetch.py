@@ -0,0 +1,89 @@
+"""
+Эффект спекулятивного prefetch на латентность хода агента без vLLM: первый вызов
+LLM имитируется задержкой и возвращает вызов `search_knowledge_base`, второй —
+готовый текст. Сравниваются прогоны с prefetch и без.
+
+    python -m bench.prefetch --llm-ms 400 --concurrency 8
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from tabulate import tabulate
+
+import agent.main as agent_main
+from agent import prefetch
+from agent.rag import get_rag
+from bench.retrieval import load_queries, percentile
+from settings import settings
+
+
+class StubLLM:
+    """
+    Первый вызов в ходе — поиск с переформулированным запросом, второй — ответ.
+    """
+
+    def __init__(self, latency_s: float):
+        self.latency_s = latency_s
+
+    def invoke(self, msgs):
+        time.sleep(self.latency_s)
+        last = msgs[-1]
+        if isinstance(last, ToolMessage):
+            return AIMessage(content="ok")
+        query = last.content.rstrip("?!. ").lower()
+        return AIMessage(
+            content="",
+            tool_calls=[{"name": prefetch.SEARCH_TOOL, "args": {"query": query}, "id": f"call_{uuid4().hex[:8]}"}],
+        )
+
+
+def run_turns(app, queries, concurrency: int):
+    def turn(query):
+        t0 = time.perf_counter()
+        app.invoke({"messages": [HumanMessage(content=query)]})
+        return (time.perf_counter() - t0) * 1000
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(turn, queries))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Speculative retrieval prefetch benchmark")
+    parser.add_argument("--llm-ms", type=float, default=400, help="Имитация задержки одного вызова LLM")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    stub = StubLLM(args.llm_ms / 1000)
+    agent_main.get_llm = lambda: stub
+    app = agent_main.build_app()
+
+    get_rag().search("warm-up")
+    queries = [q["query"] for q in load_queries()] * args.repeats
+
+    rows = []
+    for enabled in (False, True):
+        settings.PREFETCH_ENABLED = enabled
+        prefetch.STATS = prefetch.PrefetchStats()
+        latencies = run_turns(app, queries, args.concurrency)
+        stats = prefetch.STATS.snapshot()
+        rows.append(
+            {
+                "prefetch": enabled,
+                "turn_ms_p50": statistics.median(latencies),
+                "turn_ms_p95": percentile(latencies, 0.95),
+                "hit_rate": stats["hit_rate"],
+                "skipped_busy": stats["skipped_busy"],
+                "saved_ms_avg": stats["saved_ms_total"] / stats["hits"] if stats["hits"] else 0.0,
+            }
+        )
+
+    print(tabulate(rows, headers="keys", floatfmt=".1f"))
+
+
+if __name__ == "__main__":
+    main()
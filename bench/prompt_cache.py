@@ -0,0 +1,359 @@
+"""
+Стабильность префикса промпта и его эффект на время до первого токена.
+
+`--check` перехватывает тела запросов, которые ChatOpenAI отправляет на сервер, для
+разных пользователей и ходов и проверяет, что системный промпт и схемы инструментов
+совпадают побайтно, в том числе между процессами с разным PYTHONHASHSEED. При
+расхождении выходит с кодом 1, так что годится как проверка в CI.
+
+Без `--base-url` поднимается OpenAI-совместимый стаб, который имитирует prefix caching:
+prefill пропорционален длине незакэшированной части запроса. Сравниваются канонический
+промпт и промпт с изменчивым началом (время запроса в системном промпте, случайный
+порядок инструментов). С `--base-url` реального vLLM счётчики prefix cache читаются из /metrics.
+
+    python -m bench.prompt_cache --check
+    python -m bench.prompt_cache --prefill-ms-per-1k 50 --repeats 3
+    python -m bench.prompt_cache --base-url http://localhost:8000/v1
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import httpx
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_openai import ChatOpenAI
+from tabulate import tabulate
+
+from agent.main import TOOLS
+from agent.prompt import PROMPT_VERSION, SYSTEM_PROMPT, assemble, tool_schemas
+from bench.retrieval import load_queries, percentile
+from settings import settings
+
+
+CONVERSATIONS = {
+    "anna": ["What vegetarian pizzas do you have?", "How much is the Margherita?", "Deliver one to 5 Main St"],
+    "boris": ["Book a table for 7pm, my name is Boris", "What do guests say about delivery?"],
+}
+
+
+def make_llm(tools, base_url: str = settings.LLM_BASE_URL, model: str = settings.LLM_MODEL, http_client=None):
+    return ChatOpenAI(
+        model=model, base_url=base_url, api_key=settings.LLM_API_KEY, temperature=0, http_client=http_client
+    ).bind_tools(tools)
+
+
+class PayloadRecorder:
+    """
+    ChatOpenAI с транспортом-заглушкой: запрос никуда не уходит, а его тело сохраняется
+    ровно в том виде, в каком клиент отправил бы его на сервер.
+    """
+
+    def __init__(self, tools):
+        self.last: Optional[dict] = None
+        self.llm = make_llm(tools, http_client=httpx.Client(transport=httpx.MockTransport(self._handle)))
+
+    def _handle(self, request: httpx.Request) -> httpx.Response:
+        self.last = json.loads(request.content)
+        return httpx.Response(
+            200,
+            json={
+                "id": "recorded",
+                "object": "chat.completion",
+                "created": 0,
+                "model": self.last.get("model", "stub"),
+                "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}
+                ],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            },
+        )
+
+    def payload(self, messages) -> dict:
+        self.llm.invoke(messages)
+        return self.last
+
+
+class PrefixUnstable(Exception):
+    pass
+
+
+def require(condition: bool, message: str):
+    # не assert: под `python -O` проверки не должны пропадать
+    if not condition:
+        raise PrefixUnstable(message)
+
+
+def dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def payload_prefix(payload: dict) -> str:
+    return dumps([payload.get("tools"), payload["messages"][0]])
+
+
+# ----------------------------
+# Проверка стабильности
+# ----------------------------
+
+def conversation_requests(texts: List[str]):
+    """
+    Запросы одного разговора: первый вызов LLM в ходе и второй, после инструмента.
+    """
+    history = []
+    for i, text in enumerate(texts):
+        history = history + [HumanMessage(content=text)]
+        yield True, history
+        call_id = f"call_{i}"
+        yield False, history + [
+            AIMessage(content="", tool_calls=[{"name": "search_knowledge_base", "args": {"query": text}, "id": call_id}]),
+            ToolMessage(content='{"matches":[]}', tool_call_id=call_id),
+        ]
+        history = history + [AIMessage(content=f"Answer {i}")]
+
+
+def prefix_sha() -> str:
+    payload = PayloadRecorder(tool_schemas(TOOLS)).payload(assemble([HumanMessage(content="hi")]))
+    return hashlib.sha256(payload_prefix(payload).encode("utf-8")).hexdigest()
+
+
+def check_stability(seeds=(0, 1, 4242)) -> str:
+    recorder = PayloadRecorder(tool_schemas(TOOLS))
+    prefixes = set()
+
+    for user, texts in CONVERSATIONS.items():
+        previous: Optional[List[str]] = None
+        for turn_start, history in conversation_requests(texts):
+            payload = recorder.payload(assemble(history))
+            prefix = payload_prefix(payload)
+            prefixes.add(prefix)
+            require(user not in prefix.lower(), f"user data leaked into the prefix: {user}")
+
+            # история только дописывается: начало хода продолжает предыдущий ход побайтно
+            body = [dumps(m) for m in payload["messages"]]
+            if turn_start:
+                if previous is not None:
+                    require(body[: len(previous)] == previous, f"history prefix changed between turns for {user}")
+                previous = body
+
+    # чужое системное сообщение в истории не сдвигает префикс
+    stray = recorder.payload(assemble([SystemMessage(content="debug"), HumanMessage(content="hi")]))
+    prefixes.add(payload_prefix(stray))
+    require(len(prefixes) == 1, f"{len(prefixes)} distinct prefixes across users and turns")
+
+    # порядок инструментов не зависит от порядка в TOOLS
+    shuffled = PayloadRecorder(tool_schemas(list(reversed(TOOLS)))).payload(assemble([HumanMessage(content="hi")]))
+    require(payload_prefix(shuffled) in prefixes, "tool order depends on registration order")
+
+    expected = prefix_sha()
+    for seed in seeds:
+        out = subprocess.run(
+            [sys.executable, "-m", "bench.prompt_cache", "--digest"],
+            env={**os.environ, "PYTHONHASHSEED": str(seed)},
+            capture_output=True,
+            text=True,
+        )
+        require(out.returncode == 0, f"digest subprocess failed with PYTHONHASHSEED={seed}: {out.stderr.strip()}")
+        require(out.stdout.strip() == expected, f"prefix differs in a process with PYTHONHASHSEED={seed}")
+    return expected
+
+
+# ----------------------------
+# Стаб сервера с prefix caching
+# ----------------------------
+
+class StubServer(ThreadingHTTPServer):
+    """
+    Кэш по цепочке хэшей сообщений: попадание — самое длинное уже виденное начало запроса.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, prefill_ms_per_1k: float):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        # ~4 символа на токен
+        self.prefill_s_per_char = prefill_ms_per_1k / 1000 / 1000 / 4
+        self.seen = set()
+        self.lock = threading.Lock()
+        self.query_tokens = 0
+        self.hit_tokens = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def lookup(self, parts: List[str]) -> int:
+        digest = hashlib.sha256()
+        cached, hit = 0, True
+        with self.lock:
+            for part in parts:
+                digest.update(part.encode("utf-8"))
+                key = digest.hexdigest()
+                if hit and key in self.seen:
+                    cached += len(part)
+                else:
+                    hit = False
+                    self.seen.add(key)
+            self.query_tokens += sum(map(len, parts)) // 4
+            self.hit_tokens += cached // 4
+        return cached
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = (
+            f"vllm:prefix_cache_queries_total {self.server.query_tokens}\n"
+            f"vllm:prefix_cache_hits_total {self.server.hit_tokens}\n"
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        parts = [dumps(body.get("tools"))] + [dumps(m) for m in body.get("messages", [])]
+        cached = self.server.lookup(parts)
+        time.sleep((sum(map(len, parts)) - cached) * self.server.prefill_s_per_char)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for delta, finish in (({"role": "assistant", "content": "ok"}, None), ({}, "stop")):
+            chunk = {
+                "id": "stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+            self.wfile.write(f"data: {dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+
+
+# ----------------------------
+# TTFT
+# ----------------------------
+
+def prefix_cache_metrics(base_url: str) -> Dict[str, float]:
+    """
+    Счётчики prefix cache из Prometheus-метрик vLLM, метки суммируются.
+    """
+    url = base_url.rstrip("/").removesuffix("/v1") + "/metrics"
+    try:
+        text = httpx.get(url, timeout=5).text
+    except httpx.HTTPError:
+        return {}
+
+    out: Dict[str, float] = {}
+    for line in text.splitlines():
+        if line.startswith("#") or "prefix_cache" not in line:
+            continue
+        name, _, value = line.rpartition(" ")
+        name = name.split("{")[0]
+        out[name] = out.get(name, 0.0) + float(value)
+    return out
+
+
+def hit_rate(before: Dict[str, float], after: Dict[str, float]) -> Optional[float]:
+    delta = {k: after[k] - before.get(k, 0.0) for k in after}
+    hits = sum(v for k, v in delta.items() if k.endswith("hits_total"))
+    queries = sum(v for k, v in delta.items() if k.endswith("queries_total"))
+    if queries:
+        return hits / queries
+    # старые версии vLLM отдают только gauge
+    return next((v for k, v in after.items() if k.endswith("hit_rate")), None)
+
+
+def time_to_first_token(llm, messages) -> float:
+    t0 = time.perf_counter()
+    first = None
+    for _ in llm.stream(messages):
+        if first is None:
+            first = (time.perf_counter() - t0) * 1000
+    return first
+
+
+def canonical_request(base_url: str, model: str, text: str):
+    return make_llm(tool_schemas(TOOLS), base_url, model), assemble([HumanMessage(content=text)])
+
+
+def volatile_request(base_url: str, model: str, text: str):
+    system = f"Request time: {datetime.now().isoformat()}\n{SYSTEM_PROMPT}"
+    llm = make_llm(random.sample(TOOLS, len(TOOLS)), base_url, model)
+    return llm, [SystemMessage(content=system), HumanMessage(content=text)]
+
+
+def run_variant(name: str, build, base_url: str, model: str, queries: List[str]) -> dict:
+    before = prefix_cache_metrics(base_url)
+    latencies = [time_to_first_token(*build(base_url, model, q)) for q in queries]
+    after = prefix_cache_metrics(base_url)
+    return {
+        "prompt": name,
+        "requests": len(latencies),
+        "ttft_ms_p50": statistics.median(latencies),
+        "ttft_ms_p95": percentile(latencies, 0.95),
+        "prefix_hit_rate": hit_rate(before, after),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt prefix stability and time-to-first-token benchmark")
+    parser.add_argument("--check", action="store_true", help="Проверить побайтную стабильность префикса")
+    parser.add_argument("--digest", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", default=None, help="OpenAI-совместимый сервер; без него — стаб")
+    parser.add_argument("--model", default=settings.LLM_MODEL)
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=50, help="Prefill стаба на 1000 токенов")
+    parser.add_argument("--repeats", type=int, default=2)
+    args = parser.parse_args()
+
+    if args.digest:
+        print(prefix_sha())
+        return
+    if args.check:
+        try:
+            digest = check_stability()
+        except PrefixUnstable as e:
+            print(f"prefix unstable: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(f"prefix stable: version {PROMPT_VERSION}, sha256 {digest[:16]}")
+        return
+
+    queries = [q["query"] for q in load_queries()] * args.repeats
+    rows = []
+    for name, build in (("volatile head", volatile_request), ("canonical", canonical_request)):
+        stub = None
+        base_url = args.base_url
+        if base_url is None:
+            stub = StubServer(args.prefill_ms_per_1k)
+            threading.Thread(target=stub.serve_forever, daemon=True).start()
+            base_url = stub.base_url
+        try:
+            rows.append(run_variant(name, build, base_url, args.model, queries))
+        finally:
+            if stub is not None:
+                stub.shutdown()
+                stub.server_close()
+
+    print(tabulate(rows, headers="keys", floatfmt=".2f"))
+
+
+if __name__ == "__main__":
+    main()
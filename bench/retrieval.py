@@ -0,0 +1,153 @@
+"""
+Офлайн-бенчмарк ретривера: качество (recall@k, MRR) против задержки и памяти.
+
+    python -m bench.retrieval \
+        --models sentence-transformers/all-MiniLM-L6-v2 onnx-int8:sentence-transformers/all-MiniLM-L6-v2 \
+        --k 3 5 8 --backends chroma inmemory
+"""
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import psutil
+from tabulate import tabulate
+from agent.embeddings import make_embeddings
+from agent.rag import DATA_DIR, DEFAULT_MODEL_NAME, doc_id, load_documents
+
+
+QUERIES_PATH = DATA_DIR / "retrieval_queries.jsonl"
+BACKENDS = ("chroma", "inmemory", "faiss")
+
+
+def load_queries(path: Path = QUERIES_PATH) -> List[dict]:
+    with path.open(encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def rss_mb() -> float:
+    return psutil.Process().memory_info().rss / 2**20
+
+
+def build_vectorstore(backend: str, documents, embeddings):
+    """
+    Строит индекс в памяти (без persist_directory), чтобы прогоны не влияли друг на друга.
+    """
+    if backend == "chroma":
+        from langchain_community.vectorstores import Chroma
+
+        return Chroma.from_documents(
+            documents,
+            embedding=embeddings,
+            collection_name=f"bench-{time.monotonic_ns()}",
+        )
+    if backend == "inmemory":
+        from langchain_core.vectorstores import InMemoryVectorStore
+
+        return InMemoryVectorStore.from_documents(documents, embedding=embeddings)
+    if backend == "faiss":
+        # faiss-cpu не входит в requirements.txt — ставится отдельно для сравнения
+        from langchain_community.vectorstores import FAISS
+
+        return FAISS.from_documents(documents, embedding=embeddings)
+    raise ValueError(f"Unknown vector store backend: {backend}")
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def evaluate(vectorstore, embeddings, queries: List[dict], k: int) -> Dict[str, float]:
+    recalls, reciprocal_ranks = [], []
+    embed_ms, search_ms = [], []
+
+    for item in queries:
+        relevant = set(item["relevant"])
+
+        t0 = time.perf_counter()
+        vector = embeddings.embed_query(item["query"])
+        t1 = time.perf_counter()
+        docs = vectorstore.similarity_search_by_vector(vector, k=k)
+        t2 = time.perf_counter()
+
+        embed_ms.append((t1 - t0) * 1000)
+        search_ms.append((t2 - t1) * 1000)
+
+        found = [doc_id(doc) for doc in docs]
+        recalls.append(len(relevant.intersection(found)) / len(relevant))
+        rank = next((i for i, d in enumerate(found, start=1) if d in relevant), None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+
+    return {
+        "recall@k": statistics.mean(recalls),
+        "mrr": statistics.mean(reciprocal_ranks),
+        "embed_ms_p50": statistics.median(embed_ms),
+        "embed_ms_p95": percentile(embed_ms, 0.95),
+        "search_ms_p50": statistics.median(search_ms),
+        "search_ms_p95": percentile(search_ms, 0.95),
+    }
+
+
+def run(models: List[str], ks: List[int], backends: List[str], queries_path: Path) -> List[dict]:
+    documents = load_documents()
+    queries = load_queries(queries_path)
+    rows: List[dict] = []
+
+    for model_name in models:
+        rss_before_model = rss_mb()
+        t0 = time.perf_counter()
+        embeddings = make_embeddings(model_name)
+        model_load_s = time.perf_counter() - t0
+        model_mb = rss_mb() - rss_before_model
+
+        # прогрев, чтобы первая итерация не попадала в латентность
+        embeddings.embed_query("warm-up")
+
+        for backend in backends:
+            rss_before_index = rss_mb()
+            t0 = time.perf_counter()
+            vectorstore = build_vectorstore(backend, documents, embeddings)
+            build_s = time.perf_counter() - t0
+            index_mb = rss_mb() - rss_before_index
+
+            for k in ks:
+                metrics = evaluate(vectorstore, embeddings, queries, k)
+                rows.append(
+                    {
+                        "model": model_name,
+                        "backend": backend,
+                        "k": k,
+                        **metrics,
+                        "model_load_s": model_load_s,
+                        "index_build_s": build_s,
+                        "model_rss_mb": model_mb,
+                        "index_rss_mb": index_mb,
+                        "docs": len(documents),
+                    }
+                )
+
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval quality vs latency benchmark")
+    parser.add_argument("--models", nargs="+", default=[DEFAULT_MODEL_NAME])
+    parser.add_argument("--k", nargs="+", type=int, default=[3, 5, 8])
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=["chroma", "inmemory"])
+    parser.add_argument("--queries", type=Path, default=QUERIES_PATH)
+    parser.add_argument("--json", type=Path, help="Дополнительно сохранить строки таблицы в JSON")
+    args = parser.parse_args()
+
+    rows = run(args.models, args.k, args.backends, args.queries)
+
+    print(tabulate(rows, headers="keys", floatfmt=".3f"))
+    if args.json:
+        args.json.write_text(json.dumps(rows, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Нагрузочное сравнение POST /agent/ и WebSocket /agent/ws на работающем сервере.
+
+Каждый виртуальный клиент логинится, затем отправляет `--turns` сообщений в свой чат:
+через POST (JWT, пользователь, проверка чата и история на каждый ход) или через одно
+WebSocket-соединение. Для замера накладных расходов бэкенда, а не LLM, удобно поднять
+сервер с быстрым OpenAI-совместимым стабом вместо vLLM. Лимит сообщений на время
+замера нужно поднять: AGENT_RATE_LIMIT_PER_MINUTE=100000.
+
+    python -m bench.websocket --base-url http://localhost:9000 --phone 79990000000 --password secret \
+        --clients 16 --turns 5
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import List
+
+import httpx
+import websockets
+from tabulate import tabulate
+
+from bench.retrieval import percentile
+
+
+async def login(client: httpx.AsyncClient, phone: str, password: str) -> str:
+    resp = await client.post("/auth/login", params={"phone": phone, "password": password})
+    resp.raise_for_status()
+    return resp.json()["access_token"]
+
+
+async def post_client(base_url: str, token: str, messages: List[str], latencies: List[float]):
+    async with httpx.AsyncClient(base_url=base_url, cookies={"access_token": token}, timeout=120) as client:
+        chat_id = None
+        for text in messages:
+            params = {"message": text}
+            if chat_id is not None:
+                params["chat_id"] = chat_id
+            t0 = time.perf_counter()
+            resp = await client.post("/agent/", params=params)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            resp.raise_for_status()
+            chat_id = resp.json()["chat_id"]
+
+
+async def ws_client(base_url: str, token: str, messages: List[str], latencies: List[float]):
+    url = base_url.replace("http", "ws", 1) + "/agent/ws"
+    async with websockets.connect(url, additional_headers={"Cookie": f"access_token={token}"}) as ws:
+        ready = json.loads(await ws.recv())
+        assert ready["type"] == "ready", ready
+        for text in messages:
+            t0 = time.perf_counter()
+            await ws.send(json.dumps({"message": text}))
+            while True:
+                event = json.loads(await ws.recv())
+                if event["type"] in ("message", "error"):
+                    break
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+
+async def run(args) -> List[dict]:
+    async with httpx.AsyncClient(base_url=args.base_url) as client:
+        token = await login(client, args.phone, args.password)
+
+    messages = [f"{args.message} #{i}" for i in range(args.turns)]
+    rows = []
+    for name, client_fn in (("POST /agent/", post_client), ("WS /agent/ws", ws_client)):
+        latencies: List[float] = []
+        t0 = time.perf_counter()
+        await asyncio.gather(
+            *(client_fn(args.base_url, token, messages, latencies) for _ in range(args.clients))
+        )
+        elapsed = time.perf_counter() - t0
+        rows.append(
+            {
+                "transport": name,
+                "turns": len(latencies),
+                "turn_ms_p50": statistics.median(latencies),
+                "turn_ms_p95": percentile(latencies, 0.95),
+                "turns_per_s": len(latencies) / elapsed,
+            }
+        )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="POST vs WebSocket chat concurrency benchmark")
+    parser.add_argument("--base-url", default="http://localhost:9000")
+    parser.add_argument("--phone", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--message", default="What pizzas do you have?")
+    args = parser.parse_args()
+
+    print(tabulate(asyncio.run(run(args)), headers="keys", floatfmt=".1f"))
+
+
+if __name__ == "__main__":
+    main()
@@ -9,10 +9,83 @@ class Settings:
     POSTGRES_DB: str = os.getenv("POSTGRES_DB")
     POSTGRES_HOST: str = os.getenv("POSTGRES_HOST", "localhost")
     POSTGRES_PORT: int = os.getenv("POSTGRES_PORT", 5432)
+
+    # dev — логирование SQL, prod — пул под нагрузку без echo, bench — без проверок соединений
+    DB_PROFILE: str = os.getenv("DB_PROFILE", "dev")
+    DB_ENGINE_PROFILES: dict = {
+        "dev": {
+            "echo": True,
+            "pool_size": 5,
+            "max_overflow": 10,
+            "pool_timeout": 30,
+            "pool_pre_ping": False,
+            "pool_recycle": -1,
+            "prepared_statement_cache_size": 100,
+        },
+        "prod": {
+            "echo": False,
+            "pool_size": int(os.getenv("DB_POOL_SIZE", 20)),
+            "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 10)),
+            "pool_timeout": 10,
+            "pool_pre_ping": True,
+            "pool_recycle": 1800,
+            "prepared_statement_cache_size": 500,
+        },
+        "bench": {
+            "echo": False,
+            "pool_size": int(os.getenv("DB_POOL_SIZE", 50)),
+            "max_overflow": 0,
+            "pool_timeout": 30,
+            "pool_pre_ping": False,
+            "pool_recycle": -1,
+            "prepared_statement_cache_size": 1000,
+        },
+    }
+    # запрос, превысивший бюджет, попадает в лог с путём эндпоинта
+    DB_QUERY_BUDGET: int = int(os.getenv("DB_QUERY_BUDGET", 8))
+    DB_TIME_BUDGET_MS: float = float(os.getenv("DB_TIME_BUDGET_MS", 50))
     
     SECRET_KEY: str =  os.getenv("SECRET_KEY")
     ALGORITHM: str = os.getenv("ALGORITHM" ,"HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+
+    # любой OpenAI-совместимый сервер (по умолчанию локальный vLLM из llm/)
+    LLM_MODEL: str = os.getenv("LLM_MODEL", "Qwen/Qwen2.5-3B-Instruct")
+    LLM_BASE_URL: str = os.getenv("LLM_BASE_URL", "http://localhost:8000/v1")
+    LLM_API_KEY: str = os.getenv("LLM_API_KEY", "EMPTY")
+
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    EMBEDDING_BACKEND: str = os.getenv("EMBEDDING_BACKEND", "torch")  # torch | onnx | onnx-int8
+    EMBEDDING_THREADS: int = int(os.getenv("EMBEDDING_THREADS", 0))  # 0 = по числу ядер
+    ONNX_MODEL_DIR: str = os.getenv(
+        "ONNX_MODEL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "onnx")
+    )
+
+    # токенизатор обслуживающей модели — для подсчёта токенов контекста из поиска
+    TOKENIZER_NAME: str = os.getenv("TOKENIZER_NAME", LLM_MODEL)
+    CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", 600))
+
+    # спекулятивный поиск по сообщению пользователя параллельно с первым вызовом LLM
+    PREFETCH_ENABLED: bool = os.getenv("PREFETCH_ENABLED", "1").lower() in ("1", "true", "yes")
+    PREFETCH_MAX_INFLIGHT: int = int(os.getenv("PREFETCH_MAX_INFLIGHT", 4))
+    PREFETCH_SIMILARITY: float = float(os.getenv("PREFETCH_SIMILARITY", 0.8))
+
+    # общий лимит сообщений агенту для POST /agent/ и WebSocket
+    AGENT_RATE_LIMIT_PER_MINUTE: int = int(os.getenv("AGENT_RATE_LIMIT_PER_MINUTE", 5))
+    WS_MAX_CONNECTIONS: int = int(os.getenv("WS_MAX_CONNECTIONS", 200))
+    WS_IDLE_TIMEOUT: float = float(os.getenv("WS_IDLE_TIMEOUT", 300))  # секунды
+
+    # компактизация неактивных чатов (backend/database/retention.py); 0 минут — фоновая задача выключена
+    RETENTION_IDLE_DAYS: int = int(os.getenv("RETENTION_IDLE_DAYS", 30))
+    RETENTION_BATCH_SIZE: int = int(os.getenv("RETENTION_BATCH_SIZE", 100))
+    RETENTION_PAUSE_SECONDS: float = float(os.getenv("RETENTION_PAUSE_SECONDS", 0.5))
+    RETENTION_INTERVAL_MINUTES: float = float(os.getenv("RETENTION_INTERVAL_MINUTES", 0))
+    CHAT_PARTITIONING: bool = os.getenv("CHAT_PARTITIONING", "0").lower() in ("1", "true", "yes")
+
+    # API-only воркеры (ENABLE_AGENT=0) не импортируют агента, LangGraph и RAG вовсе
+    ENABLE_AGENT: bool = os.getenv("ENABLE_AGENT", "1").lower() in ("1", "true", "yes")
+    AGENT_WARMUP: bool = os.getenv("AGENT_WARMUP", "0").lower() in ("1", "true", "yes")
+    SETUP_DB_ON_STARTUP: bool = os.getenv("SETUP_DB_ON_STARTUP", "0").lower() in ("1", "true", "yes")
     
 
 settings = Settings()